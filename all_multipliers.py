@@ -17,6 +17,7 @@ import logging as log
 import os
 import shutil
 import sys
+import tempfile
 import time
 from functools import reduce, wraps
 from os.path import join as pjoin, realpath, isdir, dirname
@@ -32,11 +33,22 @@ import terrain.terrain_mult
 import topographic.topo_mult
 from utilities import mpi_runner
 from utilities.config import configparser as config
+from utilities.derivative_cache import get_cache_folder
 from utilities.files import fl_start_log
+from utilities.get_pixel_size_grid import get_pixel_size
+from utilities.nctools import save_multiplier, get_union_extent
 from utilities.parallel import attempt_parallel, disable_on_workers
+from utilities.tile_context import TileContext
 
 __version__ = '2.0'
 
+TRIVIAL_DIRECTIONS = ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw']
+
+HALO_MULTIPLIERS = ['terrain', 'shielding', 'topographic']
+
+# the sides of a tile in the order of the halo widths
+HALO_SIDES = ['w', 'n', 'e', 's']
+
 
 class TileGrid(object):
 
@@ -97,6 +109,17 @@ class TileGrid(object):
                  str(self.y_step))
         self.x_buffer = int(upwind_length / self.pixelwidth)
         self.y_buffer = int(upwind_length / self.pixelheight)
+
+        # the smallest cell size of the raster gives the largest number of
+        # cells in the halo of a multiplier
+        cellsize = min(min(get_pixel_size(ds, (self.x_dim // 2, 0))),
+                       min(get_pixel_size(ds, (self.x_dim // 2,
+                                               self.y_dim - 1))))
+        self.halos = self.get_halos(cellsize)
+        all_halos = [halo for multiplier in HALO_MULTIPLIERS
+                     for halo in self.halos[multiplier].values()]
+        self.x_buffer = max(max(halo[0], halo[2]) for halo in all_halos)
+        self.y_buffer = max(max(halo[1], halo[3]) for halo in all_halos)
         log.info('No. of cells in the buffer of each tile in x and y is %s' %
                  str(self.x_buffer) + ', %s' %
                  str(self.y_buffer))
@@ -113,6 +136,56 @@ class TileGrid(object):
 
         ds = None
 
+    def get_halos(self, cellsize):
+        """
+        Return the number of cells read on each side of a tile by each
+        multiplier for each direction, limited to the buffer of the upwind
+        length:
+
+        - terrain: the lag and average distance on the upwind sides
+        - shielding: the convolution kernel on the upwind sides and one cell
+          on every side for the slope
+        - topographic: the buffer on both sides along the lines of the
+          direction, as the reach of a hill is not bounded, the front zone of
+          a hill extends upwind of its ridge and the ridges are paired with
+          the valleys of the whole line, and one cell across them for the
+          smoothing
+
+        :param cellsize: `float` the smallest cell size (m) of the raster
+
+        :return: `dict` of `dict` the [west, north, east, south] widths for
+                 each multiplier and direction
+
+        """
+
+        kernel_size = int(100.0 / cellsize)
+        buffers = [self.x_buffer, self.y_buffer, self.x_buffer,
+                   self.y_buffer]
+
+        halos = dict((multiplier, {}) for multiplier in HALO_MULTIPLIERS)
+        for one_dir in TRIVIAL_DIRECTIONS:
+            widths = terrain.terrain_mult.get_convo_widths(
+                one_dir, cellsize, max(self.x_dim, self.y_dim))
+            reach = sum(widths) if widths is not None else 0
+
+            upwind = [side in one_dir for side in HALO_SIDES]
+            along = [side in one_dir or HALO_SIDES[(i + 2) % 4] in one_dir
+                     for i, side in enumerate(HALO_SIDES)]
+
+            halos['terrain'][one_dir] = [
+                reach if up else 0 for up in upwind]
+            halos['shielding'][one_dir] = [
+                max(kernel_size if up else 0, 1) for up in upwind]
+            halos['topographic'][one_dir] = [
+                buffer if side else 1 for side, buffer in zip(along, buffers)]
+
+            for multiplier in HALO_MULTIPLIERS:
+                halos[multiplier][one_dir] = [
+                    min(halo, buffer) for halo, buffer in
+                    zip(halos[multiplier][one_dir], buffers)]
+
+        return halos
+
     def tile_grid(self):
         """
         Defines the indices required to subset a 2D array into smaller
@@ -238,6 +311,47 @@ class TileGrid(object):
 
         return tile_x_start, tile_y_start, tile_x_end, tile_y_end
 
+    def get_tile_extent_halo(self, k, halo):
+        """
+        Return the extent of tile `k` without buffer grown by a halo,
+        limited to the raster
+
+        :param k: `int` tile number
+        :param halo: `list` the number of cells added to the west, north,
+                     east and south
+
+        :return: minimum, maximum x and y coordinate of the halo of tile `k`
+
+        """
+
+        limits = self.get_gridlimit(k)
+        x1 = max(limits[0] - halo[0], 0)
+        y1 = max(limits[2] - halo[1], 0)
+        x2 = min(limits[1] + halo[2], self.x_dim)
+        y2 = min(limits[3] + halo[3], self.y_dim)
+
+        tile_x_start = self.x_left + x1 * self.pixelwidth
+        tile_y_start = -(self.y_upper + y1 * self.pixelheight)
+        tile_x_end = self.x_left + x2 * self.pixelwidth
+        tile_y_end = -(self.y_upper + y2 * self.pixelheight)
+
+        return tile_x_start, tile_y_start, tile_x_end, tile_y_end
+
+    def get_tile_extents_halo(self, k):
+        """
+        Return the extents of tile `k` read by each multiplier and direction
+
+        :param k: `int` tile number
+
+        :return: `dict` of `dict` the extent for each multiplier and direction
+
+        """
+
+        return dict((multiplier, dict(
+            (one_dir, self.get_tile_extent_halo(k, halo))
+            for one_dir, halo in self.halos[multiplier].items()))
+            for multiplier in HALO_MULTIPLIERS)
+
     def get_tile_extent(self, k):
         """
         Return the exntent without buffer for tile `k`. x corresponds to the
@@ -310,23 +424,31 @@ class Multipliers(object):
 
         :param tile_info: `tuple` the input tile info
 
-        :return: `file` the output dem for a tile
+        :return: `str` the workspace of the tile, holding its DEM
 
         """
 
         tile_name = tile_info[0]
         tile_extents = tile_info[1]
 
+        # only the union of the halos read by the multipliers is extracted
+        if len(tile_info) > 3:
+            tile_extents = get_union_extent(
+                [extent for halos in tile_info[3].values()
+                 for extent in halos.values()])
+
         # get the tile name without buffer using coordinates with 4 decimals
         log.info('The working tile is {0}'.format(tile_name))
         log.info('tile_extents = %s', tile_extents)
         log.info('Extract the working tile from the input DEM')
 
-        # extract the temporary tile from the dem
-        temp_tile_dem = pjoin(output_folder, tile_name + '_dem.img')
-        self.clip_dataset(tile_extents, temp_tile_dem)
+        # extract the temporary tile from the dem into the workspace of the
+        # tile, which holds all its temporary files
+        workspace = make_tile_workspace(tile_name)
+        self.clip_dataset(tile_extents, pjoin(workspace,
+                                              tile_name + '_dem.img'))
 
-        return temp_tile_dem
+        return workspace
 
     def clip_dataset(self, extent, dst_filename):
         """
@@ -364,17 +486,18 @@ class Multipliers(object):
 
         return
 
-    def multipliers_calculate(self, temp_tile_dem, tile_info):
+    def multipliers_calculate(self, workspace, tile_info):
         """
         Calculate the multiplier values for a specific tile
 
-        :param temp_tile_dem: `file` the input DEM tile
+        :param workspace: `str` the workspace of the tile, holding the input
+                          DEM tile cut by :meth:`cut_dem`
         :param tile_info: `tuple` the input tile info
 
         """
 
         tile_name = tile_info[0]
-        tile_extents_nobuffer = tile_info[2]
+        temp_tile_dem = pjoin(workspace, tile_name + '_dem.img')
 
         # check the checksum value of the terrain map tile, if it is greater
         # than 0, go ahead
@@ -390,41 +513,50 @@ class Multipliers(object):
         checksum = band.Checksum()
         log.info(f'This DEM tile checksum is {str(checksum)}')
 
+        trivial = False
         if checksum > 0:
             # extract the temporary tile from landcover
-            terrain_resample = pjoin(output_folder, tile_name + '.img')
+            terrain_resample = pjoin(workspace, tile_name + '.img')
 
             log.info('Extract the working tile from the input landcover to '
-                     'match the DEM tile')
-            reproject_dataset(self.lcv, temp_dataset, terrain_resample)
-
-            # start to calculate the multipliers
-            log.info('producing Terrain multipliers ...')
-            terrain.terrain_mult.terrain(terrain_resample,
-                                         tile_extents_nobuffer)
-
-            log.info('producing Shielding multipliers ...')
-            shielding.shield_mult.shield(terrain_resample, temp_tile_dem,
-                                         tile_extents_nobuffer)
-
-            log.info('producing Topographic multipliers ...')
-            topographic.topo_mult.topomult(temp_tile_dem,
-                                           tile_extents_nobuffer)
-
-            del temp_dataset
-            log.info('deleting the temporary files after calculation ...')
-            log.info('deleteing the temporary DEM: {0}'
-                     .format(temp_tile_dem))
-            os.remove(temp_tile_dem)
-            log.info('deleteing the temporary resampled landcover: {0}'
-                     .format(terrain_resample))
-            os.remove(terrain_resample)
+                     'match the DEM tile within the extent read by the '
+                     'terrain and shielding multipliers')
+            reproject_dataset(self.lcv, temp_dataset, terrain_resample,
+                              match_extent=get_union_extent(
+                                  list(tile_info[3]['terrain'].values()) +
+                                  list(tile_info[3]['shielding'].values())))
+
+            # read the inputs of the tile once for all the multipliers
+            terrain_resample_ds = gdal.Open(terrain_resample)
+            tile = TileContext(tile_info, output_folder, temp_dataset,
+                               terrain_resample_ds)
+            terrain_resample_ds = None
+
+            if config.getboolean('Processing', 'trivial_tiles',
+                                 fallback=True):
+                trivial = save_trivial_tile(tile)
+
+            if not trivial:
+                # start to calculate the multipliers
+                log.info('producing Terrain multipliers ...')
+                terrain.terrain_mult.terrain(tile)
+
+                log.info('producing Shielding multipliers ...')
+                shielding.shield_mult.shield(tile)
+
+                log.info('producing Topographic multipliers ...')
+                topographic.topo_mult.topomult(tile)
+
+            del tile, temp_dataset
         else:
             del temp_dataset
-            log.info('deleteing the temporary empty DEM: {0}'
-                     .format(temp_tile_dem))
-            if os.path.exists(temp_tile_dem):
-                os.remove(temp_tile_dem)
+
+        # the temporary DEM, resampled landcover and their sidecar files go
+        # with the workspace
+        log.info('deleting the workspace of the tile: {0}'.format(workspace))
+        remove_tile_workspace(workspace)
+
+        return trivial
 
     def parallelise_on_tiles(self, tiles, progress_callback=None):
         """
@@ -436,6 +568,7 @@ class Multipliers(object):
 
         work_tag = 0
         result_tag = 1
+        num_trivial = 0
         if (comm.rank == 0) and (comm.size > 1):
             if not self.dem_ds:
                 self.open_dem()
@@ -443,8 +576,8 @@ class Multipliers(object):
             p = comm.size - 1
             for d in range(1, comm.size):
                 if w < len(tiles):
-                    dem_tile = self.cut_dem(tiles[w])
-                    comm.send([dem_tile, tiles[w]], dest=d, tag=work_tag)
+                    workspace = self.cut_dem(tiles[w])
+                    comm.send([workspace, tiles[w]], dest=d, tag=work_tag)
                     log.debug("Processing tile {0}({1}) of {2} on {3}".format(
                         w, tiles[w], len(tiles), d))
                     w += 1
@@ -461,10 +594,12 @@ class Multipliers(object):
                                    status=status)
                 d = status.source
                 log.debug("Returned from {0}".format(d))
+                if result:
+                    num_trivial += 1
 
                 if w < len(tiles):
-                    dem_tile = self.cut_dem(tiles[w])
-                    comm.send([dem_tile, tiles[w]], dest=d, tag=work_tag)
+                    workspace = self.cut_dem(tiles[w])
+                    comm.send([workspace, tiles[w]], dest=d, tag=work_tag)
                     log.debug("Processing tile {0}({1}) of {2} on {3}".format(
                         w, tiles[w], len(tiles), d))
                     w += 1
@@ -491,13 +626,222 @@ class Multipliers(object):
             if not self.dem_ds:
                 self.open_dem()
             for i, tile in enumerate(tiles):
-                dem_tile = self.cut_dem(tile)
+                workspace = self.cut_dem(tile)
                 log.debug("Processing tile {0} of {1}".format(i, len(tiles)))
-                self.multipliers_calculate(dem_tile, tile)
+                if self.multipliers_calculate(workspace, tile):
+                    num_trivial += 1
 
                 if progress_callback:
                     progress_callback(i)
 
+        if comm.rank == 0:
+            log.info('{0} of {1} tiles were short-circuited as trivial '
+                     'tiles'.format(num_trivial, len(tiles)))
+
+        # each process keeps its own shielding kernels
+        kernel_cache = shielding.shield_mult.get_kernel.cache_info()
+        log.info('Shielding kernel cache on rank {0}: {1} hits, {2} misses'
+                 .format(comm.rank, kernel_cache.hits, kernel_cache.misses))
+
+
+def get_scratch_folder():
+    """
+    Return the folder of the workspaces of the tiles: the `scratch_folder`
+    of the `Processing` section if set, otherwise the output folder
+
+    :return: `str` the scratch folder
+    """
+
+    return config.get('Processing', 'scratch_folder',
+                      fallback='').strip() or output_folder
+
+
+def make_tile_workspace(tile_name):
+    """
+    Create the workspace of a tile, a folder of its own for its temporary
+    files, in the scratch folder, see :func:`get_scratch_folder`
+
+    :param tile_name: `str` the name of the tile
+
+    :return: `str` the workspace folder
+    """
+
+    scratch_folder = get_scratch_folder()
+    os.makedirs(scratch_folder, exist_ok=True)
+
+    return tempfile.mkdtemp(prefix=tile_name + '_', dir=scratch_folder)
+
+
+def remove_tile_workspace(workspace):
+    """
+    Remove the workspace of a tile with all its temporary files. Only a
+    folder of the scratch folder is removed.
+
+    :param workspace: `str` the workspace folder from
+                      :func:`make_tile_workspace`
+    """
+
+    scratch_folder = realpath(get_scratch_folder())
+    if dirname(realpath(workspace)) != scratch_folder:
+        log.critical(f'Not a workspace of the scratch folder '
+                     f'{scratch_folder}: {workspace}')
+        raise ValueError(f'{workspace} is not a tile workspace')
+
+    shutil.rmtree(workspace, ignore_errors=True)
+
+
+def check_scratch_folder(comm):
+    """
+    Check that the scratch folder is visible to all the MPI processes, as
+    the DEM tiles are cut into it by the first process and read by the
+    others. A file created by the first process must be seen by all of them,
+    which fails fast for a folder local to a node.
+
+    :param comm: the MPI communicator
+    """
+
+    if comm.size == 1:
+        return
+
+    scratch_folder = get_scratch_folder()
+    marker = None
+    if comm.rank == 0:
+        os.makedirs(scratch_folder, exist_ok=True)
+        handle, marker = tempfile.mkstemp(prefix='.scratch_',
+                                          dir=scratch_folder)
+        os.close(handle)
+    marker = comm.bcast(marker, root=0)
+
+    visible = comm.allgather(os.path.exists(marker))
+
+    comm.barrier()
+    if comm.rank == 0:
+        os.remove(marker)
+
+    if not all(visible):
+        ranks = [rank for rank, seen in enumerate(visible) if not seen]
+        log.critical(f'The scratch folder {scratch_folder} is not visible '
+                     f'to the MPI processes {ranks}, set scratch_folder to '
+                     f'a shared folder')
+        raise OSError(f'scratch_folder {scratch_folder} is not shared by '
+                      f'all the MPI processes')
+
+
+def get_trivial_multipliers(dem_data, dem_mask, lc_data, lc_mask,
+                            geotransform):
+    """
+    Detect a trivial tile, with a single landcover value and no relief, and
+    return its constant multipliers. These are derived by applying the
+    reclassification, shielding and topographic rules of the full
+    computation to a single cell.
+
+    :param dem_data: :class:`numpy.ndarray` the DEM values, NaN for nodata
+    :param dem_mask: :class:`numpy.ndarray` True for the DEM nodata cells
+    :param lc_data: :class:`numpy.ndarray` the landcover values
+    :param lc_mask: :class:`numpy.ndarray` True for the landcover nodata
+                    cells
+    :param geotransform: `tuple` the geotransform of the tile with buffer
+
+    :return: `dict` the constant 'Mz', 'Ms' and 'Mt' values, where 'Mz' is
+             None if the tile has no terrain multiplier, or None if the tile
+             is not trivial
+    """
+
+    lc_value = lc_data.flat[0]
+    if np.any(lc_data != lc_value):
+        return None
+
+    # either all nodata or a single elevation without nodata holes
+    if np.all(dem_mask):
+        dem_value = np.nan
+    elif np.any(dem_mask) or np.max(dem_data) != np.min(dem_data):
+        return None
+    else:
+        dem_value = dem_data.flat[0]
+
+    cell = np.array([[lc_value]])
+
+    mz_value = terrain.terrain_mult.terrain_class2mz_orig(
+        cell, terrain.terrain_mult.get_terrain_lookup())[0, 0]
+    if mz_value == 0 or lc_mask.flat[0]:
+        # all nodata, the terrain multiplier is skipped as in terrain()
+        mz_value = None
+
+    if lc_mask.flat[0]:
+        ms_value = np.nan
+    else:
+        ms_orig = shielding.shield_mult.get_shielding_lookup().reclassify(
+            cell).astype(float)
+        ms_value = shielding.shield_mult.combine(
+            ms_orig, np.zeros((1, 1)), np.full((1, 1), 9), 'n')[0, 0]
+
+    if np.isnan(dem_value):
+        mt_value = np.nan
+    else:
+        mt_cell = topographic.topo_mult.remove_conservatism(np.ones((1, 1)))
+        if geotransform[0] > 143.0 and -geotransform[3] > 40.0:
+            mt_cell = topographic.topo_mult.tasmania(
+                mt_cell, np.full((1, 1), dem_value))
+        mt_value = mt_cell[0, 0]
+
+    return dict([('Mz', mz_value), ('Ms', ms_value), ('Mt', mt_value)])
+
+
+def save_trivial_tile(tile):
+    """
+    Write the constant multipliers of a trivial tile directly, without
+    running the terrain, shielding and topographic computation. Only tiles
+    with a buffer on every side wider than the shielding kernel are
+    considered, so that the edge effects of the computation never reach the
+    tile.
+
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+
+    :return: `bool` True if the tile was trivial and its output written
+    """
+
+    tile_extents = tile.extents_buffer
+    tile_extents_nobuffer = tile.extents_nobuffer
+
+    pixelwidth = tile.pixelwidth
+    pixelheight = tile.pixelheight
+
+    gridwidth = tile.get_gridwidth()
+    kernel_size = max(int(100.0 / gridwidth), 1)
+
+    buffers = [(tile_extents_nobuffer[0] - tile_extents[0]) / pixelwidth,
+               (tile_extents[1] - tile_extents_nobuffer[1]) / pixelheight,
+               (tile_extents[2] - tile_extents_nobuffer[2]) / pixelwidth,
+               (tile_extents_nobuffer[3] - tile_extents[3]) / pixelheight]
+    if min(int(np.around(b)) for b in buffers) < kernel_size:
+        return False
+
+    values = get_trivial_multipliers(tile.dem, tile.dem_mask,
+                                     tile.landcover, tile.landcover_mask,
+                                     tile.dem_geotransform)
+    if values is None:
+        return False
+
+    log.info('Trivial tile, writing constant multipliers {0}'.format(
+        values))
+
+    shape = (len(tile.lat), len(tile.lon))
+
+    outputs = [('Mz', 'terrain', '_mz_'),
+               ('Ms', 'shielding', '_ms_'),
+               ('Mt', 'topographic', '_mt_')]
+    for multiplier_name, subdir, suffix in outputs:
+        if values[multiplier_name] is None:
+            continue
+        outdata = np.full(shape, values[multiplier_name], np.float32)
+        for one_dir in TRIVIAL_DIRECTIONS:
+            tile_nc = tile.get_output_file(subdir, suffix, one_dir)
+            save_multiplier(multiplier_name, outdata, tile.lat, tile.lon,
+                            tile_nc)
+
+    return True
+
 
 def get_tiles(tilegrid):
     """
@@ -518,13 +862,15 @@ def get_tileinfo(tilegrid, tilenums):
     :param tilegrid: :class:`TileGrid` instance
     :param tilenums: list of tile numbers (must be sequential)
 
-    :returns: tileinfo: list of tuples of tile names and extents
+    :returns: tileinfo: list of tuples of tile names, extents with and
+              without buffer and the extents read by each multiplier
 
     """
 
     tile_info = [
         [tilegrid.get_tilename(t), tilegrid.get_tile_extent_buffer(t),
-         tilegrid.get_tile_extent(t)] for t in tilenums]
+         tilegrid.get_tile_extent(t), tilegrid.get_tile_extents_halo(t)]
+        for t in tilenums]
     return tile_info
 
 
@@ -566,10 +912,21 @@ def do_output_directory_creation(output):
 
     subdirs_1 = ['terrain', 'shielding', 'topographic', 'M3', 'M3_max']
 
-    if os.path.exists(output):
+    # the derivative cache of previous runs is kept
+    cache_folder = get_cache_folder(output)
+    if cache_folder and os.path.isdir(cache_folder):
+        for entry in os.listdir(output):
+            path = pjoin(output, entry)
+            if path == cache_folder:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    elif os.path.exists(output):
         shutil.rmtree(output)
     try:
-        os.makedirs(output)
+        os.makedirs(output, exist_ok=True)
     except OSError:
         raise
 
@@ -586,7 +943,7 @@ def do_output_directory_creation(output):
 @timer
 def reproject_dataset(src_file, match_filename, dst_filename,
                       resampling_method=GRA_NearestNeighbour,
-                      match_projection=None):
+                      match_projection=None, match_extent=None):
     """
     Clip and reproject a source dataset to match the projection of another
     dataset and save the projected dataset to a new file.
@@ -599,6 +956,8 @@ def reproject_dataset(src_file, match_filename, dst_filename,
     :param resampling_method: Resampling method. Default is bilinear
                               interpolation.
     :param match_projection: Projection of the output
+    :param match_extent: `tuple` the extent of the output on the grid of the
+                         dataset to match to, all of it if None
 
     """
 
@@ -652,6 +1011,15 @@ def reproject_dataset(src_file, match_filename, dst_filename,
     wide = match_ds.RasterXSize
     high = match_ds.RasterYSize
 
+    if match_extent is not None:
+        wide = int(np.around((match_extent[2] - match_extent[0]) /
+                             match_geotrans[1]))
+        high = int(np.around((match_extent[3] - match_extent[1]) /
+                             match_geotrans[5]))
+        match_geotrans = (match_extent[0], match_geotrans[1],
+                          match_geotrans[2], match_extent[1],
+                          match_geotrans[4], match_geotrans[5])
+
     # Output / destination
     drv = gdal.GetDriverByName('HFA')
     dst = drv.Create(dst_filename, wide, high, 1, dst_type)
@@ -758,6 +1126,7 @@ def run():
     global output_folder
     output_folder = config.get('Output', 'output_dir')
     do_output_directory_creation(output_folder)
+    check_scratch_folder(comm)
 
     log.info("get the tiles based on the DEM")
     tg = TileGrid(upwind_length, dem)
@@ -16,12 +16,10 @@ for 8 directions and output as NetCDF format.
 """
 
 # Import system & process modules
-import sys
-import os
-import glob
 import logging as log
+from functools import partial, lru_cache
 import numexpr
-from scipy import ndimage
+from scipy import ndimage, fft
 from os.path import join as pjoin
 import numpy as np
 from osgeo.gdalconst import GDT_Float32
@@ -29,322 +27,437 @@ from osgeo import gdal
 
 from utilities.config import configparser as config
 from utilities import value_lookup
-from utilities.get_pixel_size_grid import get_pixel_size_grids, \
-                                          RADIANS_PER_DEGREE
-from utilities.nctools import save_multiplier, get_lat_lon, clip_array
-
-import pandas as pd
-
-
-def shield(terrain, input_dem, tile_extents_nobuffer):
+from utilities.classification import get_ms_lookup
+from utilities.derivative_cache import get_cache_folder, load_arrays, \
+    save_arrays
+from utilities.parallel import map_threads, get_thread_budget
+from utilities.get_pixel_size_grid import RADIANS_PER_DEGREE
+from utilities.nctools import save_multiplier, expand_window
+
+SHIELDING_ENGINES = ('auto', 'integral', 'fft', 'convolve')
+
+# The largest kernel size the `auto` engine convolves densely, larger kernels
+# are summed from cumulative sum tables. Timed over the eight directions of
+# 1000 x 1000 and 2000 x 2000 tiles, the dense convolution is the fastest up
+# to a kernel size of 6 and the cumulative sums beyond, where the FFT engine
+# was 30 to 60 % slower than the cumulative sums at all the sizes up to 40.
+CONVOLVE_MAX_KERNEL = 6
+
+# The number of kernels kept by :func:`get_kernel`, the eight directions of a
+# few kernel sizes
+KERNEL_CACHE_SIZE = 32
+
+# The kernel of each direction as the north (kern_n) or south-west (kern_sw)
+# kernel, flipped left-right or not and then turned by quarter turns
+KERNEL_ORIENTATION = dict([('n', ('n', False, 0)),
+                           ('w', ('n', False, 1)),
+                           ('s', ('n', False, 2)),
+                           ('e', ('n', False, 3)),
+                           ('sw', ('sw', False, 0)),
+                           ('ne', ('sw', False, 2)),
+                           ('se', ('sw', True, 0)),
+                           ('nw', ('sw', True, 2))])
+
+
+def shield(tile):
     """
     Performs core calculations to derive the shielding multiplier
 
-    :param terrain: `file` the input tile of the terrain class map (landcover).
-    :param input_dem: `file` the input tile of the DEM
-    :param tile_extents_nobuffer: `tuple` the input tile extent without buffer
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
 
     """
 
     log.info('Derive slope and reclassified aspect ...   ')
-    slope_array, aspect_array = get_slope_aspect(input_dem)
+    slope_array, aspect_array = tile_slope_aspect(tile)
 
     log.info(
         'Reclassfy the terrain classes into initial shielding factors ...')
-    ms_orig = terrain_class2ms_orig(terrain)
+    extent = tile.get_halo_extent('shielding')
+    data, geotransform = tile.get_landcover(extent)
+    ms_orig_array = terrain_class2ms(data, tile.get_landcover_mask(extent))
+
+    # the initial shielding factor is only written out for inspection
+    if config.getboolean('Processing', 'save_ms_orig', fallback=False):
+        ms_orig = pjoin(tile.output_folder, 'shielding',
+                        tile.name + '_ms.img')
+        log.info('Saving the initial shielding factor in {0}'.format(ms_orig))
+        save_ms_orig(ms_orig_array, geotransform, tile.projection, ms_orig)
 
     log.info(
         'Moving average and combine slope and aspect for each direction ...')
-    convo_combine(ms_orig, slope_array, aspect_array, tile_extents_nobuffer)
+    convo_combine(ms_orig_array, geotransform, slope_array, aspect_array,
+                  tile)
 
-    del slope_array, aspect_array
+    del ms_orig_array, slope_array, aspect_array
 
     log.info(
         'finish shielding multiplier computation for this tile successfully')
 
 
-def reclassify_aspect(data):
+def tile_slope_aspect(tile):
     """
-    Reclassify the aspect valus from 0 ~ 360 to 1 ~ 9
+    Calculate the slope and aspect of the tile without buffer, or read them
+    from the derivative cache when the DEM was seen by a previous run
 
-    :param data: :class:`numpy.ndarray` the input aspect values 0 ~ 360
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
 
-    :return: :class:`numpy.ndarray` the output aspect values 1 ~ 9
+    :return: :class:`numpy.ndarray` the output slope values
+    :return: :class:`numpy.ndarray` the output aspect classes (uint8)
     """
 
-    outdata = np.zeros_like(data, dtype=int)
-    outdata.fill(9)
+    cache_folder = get_cache_folder(tile.output_folder)
+    name = tile.name + '_slope_aspect'
+    key = tile.get_dem_key('shielding') if cache_folder else None
 
-    outdata[np.where((data >= 0) & (data < 22.5))] = 1
-    outdata[np.where((337.5 <= data) & (data <= 360))] = 1
+    cached = load_arrays(cache_folder, name, key)
+    if cached is not None:
+        return cached['slope'], cached['aspect']
 
-    for i in range(2, 9):
-        outdata[
-            np.where((22.5 + (i - 2) * 45 <= data) &
-                     (data < 67.5 + (i - 2) * 45))] = i
+    window = tile.get_core_window()
+    grown = expand_window(window, 1, tile.dem.shape)
+    slope_array, aspect_array = slope_aspect(
+        tile.dem[grown], tile.dem_geotransform,
+        tile.x_m_array[window], tile.y_m_array[window],
+        tuple(slice(win.start - grw.start, win.stop - grw.start)
+              for win, grw in zip(window, grown)),
+        mask=tile.dem_mask[window])
 
-    return outdata
+    save_arrays(cache_folder, name, key,
+                {'slope': slope_array, 'aspect': aspect_array})
+
+    return slope_array, aspect_array
+
+
+def reclassify_aspect(data):
+    """
+    Reclassify the aspect valus from 0 ~ 360 to 1 ~ 9: the eight 45 degree
+    sectors centred on north (1) clockwise to north-west (8), and 9 for
+    undefined aspect
+
+    :param data: :class:`numpy.ndarray` the input aspect values 0 ~ 360
+
+    :return: :class:`numpy.ndarray` the output aspect values 1 ~ 9 as uint8
+    """
+
+    # the sectors are binned in a single pass, the sector from 337.5 wraps
+    # to north and NaN or values beyond 0 ~ 360 are undefined
+    outdata = numexpr.evaluate(
+        'where((data >= 0) & (data <= 360), '
+        'floor((data + 22.5) / 45) % 8 + 1, 9)',
+        out=np.empty(data.shape, np.float32), casting='same_kind')
 
+    return outdata.astype(np.uint8)
 
-def get_slope_aspect(input_dem):
+
+def slope_aspect(elevation_array, geotransform, x_m_array, y_m_array,
+                 window, dtype=np.float32, mask=None):
     """
-    Calculate the slope and aspect from the input DEM
+    Calculate the slope and aspect of a window of the elevation. The
+    derivatives, slope and aspect are computed into preallocated arrays of
+    the given type, float32 by default.
 
-    :param input_dem: `file` the input DEM
+    :param elevation_array: :class:`numpy.ndarray` the elevation, NaN for
+                            nodata, with one cell around the window where
+                            available
+    :param geotransform: `tuple` the geotransform of the DEM
+    :param x_m_array: :class:`numpy.ndarray` the x grid size (m) of the window
+    :param y_m_array: :class:`numpy.ndarray` the y grid size (m) of the window
+    :param window: `tuple` of `slice` the rows and columns of the window in
+                   the elevation array
+    :param dtype: :class:`numpy.dtype` the type of the computation
+    :param mask: :class:`numpy.ndarray` True for the nodata cells of the
+                 window, the NaN cells of the elevation if None
 
     :return: :class:`numpy.ndarray` the output slope values
-    :return: :class:`numpy.ndarray` the output aspect values
+    :return: :class:`numpy.ndarray` the output aspect classes (uint8)
     """
 
     np.seterr(divide='ignore')
 
-    if type(input_dem) == str:
-        ds = gdal.Open(input_dem)
-    else:
-        ds = input_dem
-
-    cols = ds.RasterXSize
-    rows = ds.RasterYSize
-    geotransform = ds.GetGeoTransform()
-    pixel_x_size = abs(geotransform[1])
-    pixel_y_size = abs(geotransform[5])
-    band = ds.GetRasterBand(1)
-    elevation_array = band.ReadAsArray(0, 0, cols, rows)
-    elevation_array = elevation_array.astype(float)
-
-    nodata_value = band.GetNoDataValue()
-    if nodata_value is not None:
-        elevation_array[np.where(elevation_array == nodata_value)] = np.nan
-    else:
-        elevation_array[np.where(elevation_array is None)] = np.nan
+    inner = window
+    elevation_array = np.asarray(elevation_array, dtype=dtype)
 
-    mask = np.isnan(elevation_array)
+    if mask is None:
+        mask = np.isnan(elevation_array[inner])
 
-    x_m_array, y_m_array = get_pixel_size_grids(ds)
+    # the sobel filter of each axis is written to the same buffer, then
+    # scaled by the grid size of the window. The pixel size in degrees of the
+    # original formulation cancels out.
+    sobel_array = np.empty(elevation_array.shape, dtype)
+    shape = mask.shape
 
-    dzdx_array = ndimage.sobel(elevation_array, axis=1) / (8. * pixel_x_size)
-    dzdx_array = numexpr.evaluate("dzdx_array * pixel_x_size / x_m_array")
+    ndimage.sobel(elevation_array, axis=1, output=sobel_array)
+    dzdx_array = numexpr.evaluate(
+        "sobel_array / (8 * x_m_array)",
+        local_dict={'sobel_array': sobel_array[inner],
+                    'x_m_array': x_m_array},
+        out=np.empty(shape, dtype), casting='same_kind')
     del x_m_array
 
-    dzdy_array = ndimage.sobel(elevation_array, axis=0) / (8. * pixel_y_size)
-    dzdy_array = numexpr.evaluate("dzdy_array * pixel_y_size / y_m_array")
+    ndimage.sobel(elevation_array, axis=0, output=sobel_array)
+    dzdy_array = numexpr.evaluate(
+        "sobel_array / (8 * y_m_array)",
+        local_dict={'sobel_array': sobel_array[inner],
+                    'y_m_array': y_m_array},
+        out=np.empty(shape, dtype), casting='same_kind')
     del y_m_array
 
     # Slope
-    hypotenuse_array = np.hypot(dzdx_array, dzdy_array)
     slope_array = numexpr.evaluate(
-        "arctan(hypotenuse_array) / RADIANS_PER_DEGREE")
+        "arctan(sqrt(dzdx_array ** 2 + dzdy_array ** 2)) / "
+        "RADIANS_PER_DEGREE",
+        out=np.empty(shape, dtype), casting='same_kind')
     slope_array[mask] = np.nan
-    del hypotenuse_array
 
     # Aspect
-    # Convert angles from conventional radians to compass heading 0-360
+    # Convert angles from conventional radians to compass heading 0-360,
+    # reusing the buffer of the sobel filter
     aspect_array = numexpr.evaluate(
-        "(450 - arctan2(dzdy_array, -dzdx_array) / RADIANS_PER_DEGREE) % 360")
+        "(450 - arctan2(dzdy_array, -dzdx_array) / RADIANS_PER_DEGREE) % 360",
+        out=sobel_array[inner], casting='same_kind')
+    del dzdx_array, dzdy_array
     # Derive reclassifed aspect...
     aspect_array_reclassify = reclassify_aspect(aspect_array)
-    del aspect_array
-
-    ds = None
+    del aspect_array, sobel_array
 
     return slope_array, aspect_array_reclassify
 
 
-def get_shielding_table():
+def get_shielding_lookup():
     """
-    Read in the terrain table specified in the config file
+    Return the lookup table of the initial shielding factor for the terrain
+    table specified in the config file, built once per process
 
-    :returns: pandas.DataFrame of the terrain classification data
+    :returns: :class:`utilities.classification.LookupTable` of the initial
+              shielding factor
     """
-    log.info('Reading in the terrain table from the config file')
     terrain_table = config.get('inputValues', 'terrain_table')
 
-    ms_init = pd.read_csv(terrain_table, comment='#', index_col=False)
-
-    return ms_init
+    return get_ms_lookup(terrain_table)
 
 
-def terrain_class2ms_orig(terrain):
+def terrain_class2ms(data, mask=None):
     """
     Reclassify the terrain classes into initial shielding factors
 
-    :param terrain: `file` the input terrain class map
+    :param data: :class:`numpy.ndarray` the terrain classes
+    :param mask: :class:`numpy.ndarray` True for the nodata cells of the
+                 terrain classes, None if there are none
 
-    :return: `file` the output initial shielding value
+    :return: :class:`numpy.ndarray` the initial shielding factors, NaN for
+             nodata
     """
 
-    ms_folder = pjoin(os.path.dirname(terrain), 'shielding')
-    file_name = os.path.basename(terrain)
-    # output format as ERDAS Imagine
-    driver = gdal.GetDriverByName('HFA')
-
-    # open the tile
-    terrain_resample_ds = gdal.Open(terrain)
-
-    # get image size, format, projection
-    cols = terrain_resample_ds.RasterXSize
-    rows = terrain_resample_ds.RasterYSize
-
-    # get georeference info
-    band = terrain_resample_ds.GetRasterBand(1)
-    data = band.ReadAsArray(0, 0, cols, rows)
+    outdata = get_shielding_lookup().reclassify(data)
 
-    nodata_value = band.GetNoDataValue()
-#    if nodata_value is not None:
-#        data[np.where(data == nodata_value)] = np.nan
-#    else:
-#        data[np.where(data is None)] = np.nan
-#
-#    mask = np.isnan(data)
+    if mask is not None:
+        outdata[mask] = np.nan
 
-    if nodata_value is not None:
-        data[np.where(data == nodata_value)] = -99
-    else:
-        data[np.where(data is None)] = -99
+    return outdata
 
-    mask = np.where(data == -99)
 
-    ms_init = value_lookup.MS_INIT
-    ms_init_new = get_shielding_table()
-    outdata = np.ones_like(data, dtype=np.float32)
+def save_ms_orig(outdata, geotransform, projection, ms_orig):
+    """
+    Save the initial shielding factor as ERDAS Imagine
 
-    for ix, row in ms_init_new.iterrows():
-        category = row['CATEGORY']
-        Ms = row['SHIELDING']
-        outdata[data == category] = Ms / 100.
-    # for i in [1, 3, 4, 5]:
-    #     outdata[data == i] = ms_init[i] / 100.0
+    :param outdata: :class:`numpy.ndarray` the initial shielding values
+    :param geotransform: `tuple` the geotransform of the values
+    :param projection: `str` the projection of the values
+    :param ms_orig: `file` the output initial shielding file
 
-    outdata[mask] = np.nan
+    """
 
-    ms_orig = pjoin(ms_folder, os.path.splitext(file_name)[0] + '_ms.img')
+    driver = gdal.GetDriverByName('HFA')
     ms_orig_ds = driver.Create(
         ms_orig,
-        terrain_resample_ds.RasterXSize,
-        terrain_resample_ds.RasterYSize,
+        outdata.shape[1],
+        outdata.shape[0],
         1,
         GDT_Float32)
-    ms_orig_ds.SetGeoTransform(terrain_resample_ds.GetGeoTransform())
-    ms_orig_ds.SetProjection(terrain_resample_ds.GetProjection())
+    ms_orig_ds.SetGeoTransform(geotransform)
+    ms_orig_ds.SetProjection(projection)
 
     outband_ms_orig = ms_orig_ds.GetRasterBand(1)
     outband_ms_orig.WriteArray(outdata)
-    del outdata
 
     # flush data to disk, set the NoData value and calculate stats
     outband_ms_orig.FlushCache()
     outband_ms_orig.SetNoDataValue(-99)
     outband_ms_orig.GetStatistics(0, 1)
 
-    terrain_resample_ds = None
-
-    return ms_orig
+    ms_orig_ds = None
 
 
-def convo_combine(ms_orig, slope_array, aspect_array, tile_extents_nobuffer):
+def convo_combine(ms_orig_array, geotransform, slope_array, aspect_array,
+                  tile):
     """
     Apply convolution to the orginal shielding factor for each direction and
     call the :term:`combine` module to consider the slope and aspect and remove
     conservitism to get final shielding multiplier values
 
-    :param ms_orig: `file` the original shidelding factor map
+    :param ms_orig_array: :class:`numpy.ndarray` the original shielding
+                          factor
+    :param geotransform: `tuple` the geotransform of the original shielding
+                         factor
     :param slope_array: :class:`numpy.ndarray` the input slope values
     :param aspect_array: :class:`numpy.ndarray` the input aspect values
-    :param tile_extents_nobuffer: `tuple` the input tile extent without buffer
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
 
     """
 
-    ms_orig_ds = gdal.Open(ms_orig)
-    if ms_orig_ds is None:
-        log.info('Could not open ' + ms_orig)
-        sys.exit(1)
+    # the average grid size is that of the tile with buffer, which the DEM
+    # tile spans
+    gridwidth = tile.get_gridwidth()
+
+    log.info('gridwidth is {0}'.format(gridwidth))
+
+    dire = ['w', 'e', 'n', 's', 'nw', 'ne', 'se', 'sw']
 
-    log.info('ms_orig is {0}'.format(ms_orig))
+    kernel_size = int(100.0 / gridwidth)
 
-    # get image size, format, projection
-    cols = ms_orig_ds.RasterXSize
-    rows = ms_orig_ds.RasterYSize
-    geotransform = ms_orig_ds.GetGeoTransform()
-    x_left = geotransform[0]
-    y_upper = -geotransform[3]
-    pixelwidth = geotransform[1]
-    pixelheight = -geotransform[5]
+    log.info('convolution kernel size is {0}'.format(str(kernel_size)))
 
-    lon, lat = get_lat_lon(tile_extents_nobuffer, pixelwidth, pixelheight)
+    engine = get_shielding_engine(kernel_size)
+    log.info('Shielding convolution engine is {0}'.format(engine))
 
-    band = ms_orig_ds.GetRasterBand(1)
-    data = band.ReadAsArray(0, 0, cols, rows)
+    # the spectrum of the initial shielding factor is shared by the kernels
+    # of all directions, so it spans the union of their upwind halos
+    spectrum = None
+    if engine == 'fft' and kernel_size > 0:
+        spectrum = ImageSpectrum(ms_orig_array, kernel_size,
+                                 tile.get_core_window(geotransform))
 
-    if ms_orig_ds is None:
-        log.info('Could not open {0}'.format(ms_orig))
-        sys.exit(1)
+    # the directions are computed concurrently when threads are configured
+    # and saved one at a time
+    results = map_threads(partial(convo_tile_direction, tile=tile,
+                                  data=ms_orig_array,
+                                  geotransform=geotransform,
+                                  slope_array=slope_array,
+                                  aspect_array=aspect_array,
+                                  kernel_size=kernel_size, engine=engine,
+                                  spectrum=spectrum),
+                          dire)
 
-    x_m_array, y_m_array = get_pixel_size_grids(ms_orig_ds)
-    gridwidth = 0.5 * (np.mean(x_m_array) + np.mean(y_m_array))
+    for one_dir, result in zip(dire, results):
 
-    log.info('gridwidth is {0}'.format(gridwidth))
+        log.info(one_dir)
+        log.debug('Maximum shielding value is {0}'.format(result.max()))
+        log.debug('Minimum shielding value is {0}'.format(result.min()))
 
-    ms_folder = os.path.dirname(ms_orig)
-    file_name = os.path.basename(ms_orig)
+        # output format as netCDF4
+        tile_nc = tile.get_output_file('shielding', '_ms_', one_dir)
+        log.info("Saving shielding multiplier in netCDF file")
 
-    dire = ['w', 'e', 'n', 's', 'nw', 'ne', 'se', 'sw']
+        save_multiplier('Ms', result, tile.lat, tile.lon, tile_nc)
 
-    for one_dir in dire:
+        del result
 
-        log.info(one_dir)
 
-        kernel_size = int(100.0 / gridwidth)
+def get_shielding_engine(kernel_size=None):
+    """
+    Read the shielding convolution engine from the config file. The
+    `integral` engine sums the kernels from cumulative sum tables at a cost
+    independent of the kernel size, `fft` transforms the initial shielding
+    factor once for all directions and `convolve` is the original dense
+    convolution. `auto` (default) convolves the kernels up to
+    :data:`CONVOLVE_MAX_KERNEL` densely and sums the larger ones.
 
-        log.info('convolution kernel size is {0}'.format(str(kernel_size)))
+    :param kernel_size: `int` the buffer size of the convolution, to
+                        resolve the `auto` engine
 
-        # if the resolution size is bigger than 100 m, no covolution just copy
-        # the initial shielding factor to each direction
-        if kernel_size > 0:
-            outdata = np.zeros((rows, cols), np.float32)
+    :returns: `str` the name of the engine
+    """
+    engine = config.get('Processing', 'shielding_engine',
+                        fallback='auto').strip().lower()
+    if engine not in SHIELDING_ENGINES:
+        log.critical(f'Unknown shielding engine: {engine}')
+        raise ValueError(
+            f'shielding_engine must be one of {SHIELDING_ENGINES}')
 
-            kern_dir = globals()['kern_' + one_dir]
-            mask = kern_dir(kernel_size)
-            outdata = blur_image(data, mask)
+    if engine == 'auto' and kernel_size is not None:
+        if kernel_size <= CONVOLVE_MAX_KERNEL:
+            engine = 'convolve'
         else:
-            outdata = data
+            engine = 'integral'
 
-        result = combine(outdata, slope_array, aspect_array, one_dir)
-        log.debug('Maximum shielding value is {0}'.format(result.max()))
-        log.debug('Minimum shielding value is {0}'.format(result.min()))
-        del outdata
+    return engine
 
-        # output format as netCDF4
-        tile_nc = pjoin(
-            ms_folder,
-            os.path.splitext(file_name)[0] +
-            '_' +
-            one_dir +
-            '.nc')
-        log.info("Saving shielding multiplier in netCDF file")
 
-        result_nobuffer = clip_array(result, x_left, y_upper, pixelwidth,
-                                     pixelheight, tile_extents_nobuffer)
+def convo_tile_direction(one_dir, tile, data, geotransform, slope_array,
+                         aspect_array, kernel_size, engine='integral',
+                         spectrum=None):
+    """
+    Apply the convolution of one direction to the original shielding factor
+    of a tile within the upwind halo of the direction and combine it with
+    the slope and aspect
+
+    :param one_dir: `str` the direction of wind
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+    :param data: :class:`numpy.ndarray` the original shielding factor within
+                 the shielding halos of the tile
+    :param geotransform: `tuple` the geotransform of the data
+    :param slope_array: :class:`numpy.ndarray` the slope values of the tile
+                        without buffer
+    :param aspect_array: :class:`numpy.ndarray` the aspect values of the tile
+                         without buffer
+    :param kernel_size: `int` the buffer size of the convolution
+    :param engine: `str` the convolution engine, `integral`, `fft` or
+                   `convolve`
+    :param spectrum: :class:`ImageSpectrum` the spectrum of the original
+                     shielding factor for the `fft` engine
 
-        save_multiplier('Ms', result_nobuffer, lat, lon, tile_nc)
+    :return: :class:`numpy.ndarray` the output shielding mutipler values
+    """
 
-        del result
+    if spectrum is None:
+        data, geotransform, window = tile.get_halo_layer(
+            data, geotransform, 'shielding', [one_dir])
+    else:
+        window = tile.get_core_window(geotransform)
 
-    ms_orig_ds = None
-    try:
-        os.remove(ms_orig)
-    except:
-        pass
-    os.chdir(ms_folder)
-    filelist = glob.glob('*.xml')
+    return convo_direction(one_dir, data, slope_array, aspect_array,
+                           kernel_size, window, engine, spectrum)
+
+
+def convo_direction(one_dir, data, slope_array, aspect_array, kernel_size,
+                    window, engine='integral', spectrum=None):
+    """
+    Apply the convolution of one direction to the original shielding factor
+    and combine it with the slope and aspect
 
-    log.debug("useless xml files: {0}".format(repr(filelist)))
+    :param one_dir: `str` the direction of wind
+    :param data: :class:`numpy.ndarray` the original shielding factor
+    :param slope_array: :class:`numpy.ndarray` the slope values of the window
+    :param aspect_array: :class:`numpy.ndarray` the aspect values of the
+                         window
+    :param kernel_size: `int` the buffer size of the convolution
+    :param window: `tuple` of `slice` the rows and columns evaluated
+    :param engine: `str` the convolution engine, `integral`, `fft` or
+                   `convolve`
+    :param spectrum: :class:`ImageSpectrum` the spectrum of the original
+                     shielding factor for the `fft` engine
 
-    if len(filelist) != 0:
-        for f in filelist:
-            try:
-                os.remove(f)
-            except OSError:
-                pass
+    :return: :class:`numpy.ndarray` the output shielding mutipler values
+    """
+
+    # if the resolution size is bigger than 100 m, no covolution just copy
+    # the initial shielding factor to each direction
+    if kernel_size > 0 and engine == 'integral':
+        outdata = integral_blur(data, one_dir, kernel_size, window=window)
+    elif kernel_size > 0:
+        mask = get_kernel(one_dir, kernel_size)
+        if engine == 'fft':
+            outdata = spectrum.blur(mask)
+        else:
+            outdata = blur_image(data, mask, window=window)
+    else:
+        outdata = data[window].copy()
+
+    return combine(outdata, slope_array, aspect_array, one_dir)
 
 
 def combine(ms_orig_array, slope_array, aspect_array, one_dir):
@@ -355,7 +468,7 @@ def combine(ms_orig_array, slope_array, aspect_array, one_dir):
 
     :param ms_orig_array: :class:`numpy.ndarray` convoluted shielding values
     :param slope_array: :class:`numpy.ndarray` the input slope values
-    :param aspect_array_reclassify: :class:`numpy.ndarray` input aspect values
+    :param aspect_array: :class:`numpy.ndarray` the aspect classes 1 ~ 9
     :param one_dir: `str` the direction of wind
 
     :return: :class:`numpy.ndarray` the output shielding mutipler values
@@ -368,33 +481,45 @@ def combine(ms_orig_array, slope_array, aspect_array, one_dir):
     up_degree = 12.30
     low_degree = 3.27
 
-    out_ms = ms_orig_array
+    # slopes facing the wind raise the shielding factor, to 1.0 from the
+    # upper limit and linearly in between, NaN stays NaN
+    facing = '(aspect == aspect_value)'
+    middle = ('((1.0 - ms) * (slope - low_degree) / (up_degree - low_degree)'
+              ' + ms)')
+    # the conservatism is removed from the adjusted factor
+    remove = 'where({0} < conservatism, {0} * conservatism, {0} ** 2)'
+
+    # the whole adjustment is evaluated in a single pass, in place
+    expression = ('where({0} & (slope >= up_degree) & (ms == ms), 1.0, '
+                  'where({0} & (slope > low_degree), {1}, {2}))').format(
+        facing, remove.format(middle), remove.format('ms'))
 
-    mask = np.isnan(out_ms)
-    out_ms[mask] = -99
+    return numexpr.evaluate(
+        expression,
+        local_dict={'ms': ms_orig_array, 'slope': slope_array,
+                    'aspect': aspect_array, 'aspect_value': aspect_value,
+                    'up_degree': up_degree, 'low_degree': low_degree,
+                    'conservatism': conservatism},
+        out=ms_orig_array, casting='same_kind')
 
-    slope_uplimit = np.where(
-        (slope_array >= 12.30) & (
-            aspect_array == aspect_value))
-    slope_middle = np.where(
-        (slope_array > 3.27) & (
-            slope_array < 12.30) & (
-            aspect_array == aspect_value))
 
-    out_ms[slope_uplimit] = 1.0
-    out_ms[slope_middle] = (
-        (1.0 - ms_orig_array[slope_middle]) * (
-            slope_array[slope_middle] - low_degree) / (
-            up_degree - low_degree)) + ms_orig_array[slope_middle]
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def get_kernel(one_dir, size):
+    """
+    Return the mean kernel of a direction, built once per process for each
+    kernel size. The hits and misses are reported by
+    `get_kernel.cache_info()`.
 
-    ms_smaller = np.where(out_ms < conservatism)
-    ms_bigger = np.where(out_ms >= conservatism)
-    out_ms[ms_smaller] = out_ms[ms_smaller] * conservatism
-    out_ms[ms_bigger] = out_ms[ms_bigger] ** 2
+    :param one_dir: `str` the direction of wind
+    :param size: `int` the buffer size of the convolution
+
+    :return: :class:`numpy.ndarray` the read-only kernel used for convolution
+    """
 
-    out_ms[mask] = np.nan
+    kernel = globals()['kern_' + one_dir](size)
+    kernel.setflags(write=False)
 
-    return out_ms
+    return kernel
 
 
 def init_kern_diag(size):
@@ -540,15 +665,224 @@ def kern_se(size):
     return np.fliplr(init_kern_diag(size))
 
 
-def blur_image(im, kernel, mode='constant'):
+def blur_image(im, kernel, mode='constant', window=None):
     """
     Blurs the image by convolving with a kernel (e.g. mean or gaussian) of
     typical size.
 
     :param im: :class:`numpy.ndarray` input data of initial shielding values
     :param kernel: :class:`numpy.ndarray` the kernel used for convolution
+    :param mode: `str` how the image is extended beyond its edges
+    :param window: `tuple` of `slice` the rows and columns evaluated, the
+                   whole image if None
+
+    :return: :class:`numpy.ndarray` the output data afer convolution
+    """
+    if window is None:
+        return ndimage.convolve(im, kernel, mode=mode, cval=1.0)
+
+    if mode != 'constant':
+        return ndimage.convolve(im, kernel, mode=mode, cval=1.0)[window]
+
+    # the cells beyond the image are the constant 1.0 whether the window is
+    # convolved alone or within the whole image, so only the window grown by
+    # the kernel radius is read
+    grown = expand_window(window, max(kernel.shape) // 2, im.shape)
+    improc = ndimage.convolve(im[grown], kernel, mode=mode, cval=1.0)
+
+    return improc[tuple(slice(win.start - grw.start, win.stop - grw.start)
+                        for win, grw in zip(window, grown))]
+
+
+def integral_blur(im, one_dir, size, window=None):
+    """
+    Blurs the image with the mean kernel of a direction, as
+    :func:`blur_image` does with the kernel from :func:`kern_n` ...
+    :func:`kern_sw` in constant mode. The kernel is summed from cumulative
+    sum tables, so the cost does not grow with the kernel size. NaN values
+    spread to the cells whose kernel covers them.
+
+    :param im: :class:`numpy.ndarray` input data of initial shielding values
+    :param one_dir: `str` the direction of wind
+    :param size: `int` the buffer size of the convolution
+    :param window: `tuple` of `slice` the rows and columns evaluated, the
+                   whole image if None
 
     :return: :class:`numpy.ndarray` the output data afer convolution
     """
-    improc = ndimage.convolve(im, kernel, mode=mode, cval=1.0)
-    return(improc)
+
+    if window is None:
+        window = (slice(0, im.shape[0]), slice(0, im.shape[1]))
+
+    # the window grown by the kernel radius is turned so that the kernel of
+    # the direction becomes the north or south-west kernel
+    grown = expand_window(window, size, im.shape)
+    base, flip, turns = KERNEL_ORIENTATION[one_dir]
+    data = im[grown]
+    if flip:
+        data = np.fliplr(data)
+    data = np.rot90(data, -turns)
+
+    if base == 'n':
+        kernel_sum, count = sum_kern_n, 3 * size - 2
+    else:
+        kernel_sum, count = sum_kern_sw, size * (size + 1) // 2
+
+    nan_mask = np.isnan(data)
+    outdata = kernel_sum(np.where(nan_mask, 0., data), size, 1.0) / count
+    if nan_mask.any():
+        outdata[kernel_sum(nan_mask.astype(float), size, 0.) > 0] = np.nan
+
+    outdata = np.rot90(outdata, turns)
+    if flip:
+        outdata = np.fliplr(outdata)
+
+    inner = tuple(slice(win.start - grw.start, win.stop - grw.start)
+                  for win, grw in zip(window, grown))
+
+    return outdata[inner].astype(im.dtype)
+
+
+def sum_kern_n(data, size, cval):
+    """
+    Sum the cells covered by the north kernel of :func:`kern_n` for each
+    cell: the cell above, and the three cells wide band from 2 to `size`
+    cells above
+
+    :param data: :class:`numpy.ndarray` the input values
+    :param size: `int` the buffer size of the convolution
+    :param cval: `float` the value beyond the edges of the input
+
+    :return: :class:`numpy.ndarray` the sums
+    """
+
+    rows, cols = data.shape
+    padded = np.pad(data.astype(float), ((size, 0), (1, 1)),
+                    constant_values=cval)
+
+    band = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+    cumsum = np.zeros((rows + size + 1, cols))
+    np.cumsum(band, axis=0, out=cumsum[1:])
+
+    return padded[size - 1:size - 1 + rows, 1:-1] + \
+        cumsum[size - 1:size - 1 + rows] - cumsum[:rows]
+
+
+def sum_kern_sw(data, size, cval):
+    """
+    Sum the cells covered by the south-west kernel of :func:`kern_sw` for
+    each cell: the triangle of the cells 1 to `size` columns to the left and
+    1 to `size` + 1 - column rows below
+
+    :param data: :class:`numpy.ndarray` the input values
+    :param size: `int` the buffer size of the convolution
+    :param cval: `float` the value beyond the edges of the input
+
+    :return: :class:`numpy.ndarray` the sums
+    """
+
+    rows, cols = data.shape
+    padded = np.pad(data.astype(float), ((0, size + 1), (size, 0)),
+                    constant_values=cval)
+
+    # cumulative sums down the columns, then along the rows and along the
+    # diagonals of the column sums, each with a leading zero
+    colsum = np.zeros((rows + size + 2, cols + size))
+    np.cumsum(padded, axis=0, out=colsum[1:])
+
+    rowsum = np.zeros((rows + size + 2, cols + size + 1))
+    np.cumsum(colsum, axis=1, out=rowsum[:, 1:])
+
+    diagsum = np.zeros((rows + size + 3, cols + size + 1))
+    diagsum[1:, 1:] = colsum
+    for row in range(2, diagsum.shape[0]):
+        diagsum[row, 1:] += diagsum[row - 1, :-1]
+
+    # each column of the triangle ends at the same row below the cell and
+    # starts one row further down for each column further to the left
+    return diagsum[size + 2:size + 2 + rows, size:size + cols] - \
+        diagsum[2:2 + rows, :cols] - \
+        rowsum[1:1 + rows, size:size + cols] + rowsum[1:1 + rows, :cols]
+
+
+class ImageSpectrum(object):
+
+    """
+    The spectrum of an image around a window, transformed once and blurred
+    by several kernels of the same size as :func:`blur_image` does in
+    constant mode
+
+    """
+
+    def __init__(self, im, size, window=None):
+        """
+        Transform the image within the window grown by the kernel radius
+
+        :param im: :class:`numpy.ndarray` input data of initial shielding
+                   values
+        :param size: `int` the buffer size of the kernels
+        :param window: `tuple` of `slice` the rows and columns evaluated, the
+                       whole image if None
+
+        """
+
+        if window is None:
+            window = (slice(0, im.shape[0]), slice(0, im.shape[1]))
+
+        grown = expand_window(window, size, im.shape)
+        data = im[grown]
+
+        # the image is padded by the kernel radius with the constant 1.0, the
+        # circular convolution then wraps into the padding only
+        padded = np.pad(data.astype(float), size, constant_values=1.0)
+        self.shape = tuple(fft.next_fast_len(length, real=True)
+                           for length in padded.shape)
+        self.dtype = im.dtype
+        self.rows = slice(2 * size + window[0].start - grown[0].start,
+                          2 * size + window[0].stop - grown[0].start)
+        self.cols = slice(2 * size + window[1].start - grown[1].start,
+                          2 * size + window[1].stop - grown[1].start)
+
+        workers = get_thread_budget()
+        nan_mask = np.isnan(padded)
+        padded[nan_mask] = 0.
+        self.spectrum = fft.rfft2(padded, self.shape, workers=workers)
+        self.nan_spectrum = None
+        if nan_mask.any():
+            self.nan_spectrum = fft.rfft2(nan_mask.astype(float), self.shape,
+                                          workers=workers)
+
+    def blur(self, kernel):
+        """
+        Blurs the image by convolving with a kernel
+
+        :param kernel: :class:`numpy.ndarray` the kernel used for convolution
+
+        :return: :class:`numpy.ndarray` the output data afer convolution of
+                 the window
+        """
+
+        outdata = self.convolve(self.spectrum, kernel)
+
+        # NaN spreads to the cells whose kernel covers it with a weight
+        if self.nan_spectrum is not None:
+            nan_count = self.convolve(self.nan_spectrum,
+                                      (kernel != 0).astype(float))
+            outdata[nan_count > 0.5] = np.nan
+
+        return outdata.astype(self.dtype)
+
+    def convolve(self, spectrum, kernel):
+        """
+        Convolve a spectrum with a kernel and return the window
+
+        :param spectrum: :class:`numpy.ndarray` the spectrum of the image
+        :param kernel: :class:`numpy.ndarray` the kernel used for convolution
+
+        :return: :class:`numpy.ndarray` the convolution within the window
+        """
+
+        outdata = fft.irfft2(spectrum * fft.rfft2(kernel, self.shape),
+                             self.shape)
+
+        return outdata[self.rows, self.cols]
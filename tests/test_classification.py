@@ -0,0 +1,98 @@
+"""
+ Title: test_classification.py
+ Description: Unit testing module for the lookup tables in
+ classification.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_almost_equal
+
+
+class TestClassification(unittest.TestCase):
+
+    def setUp(self):
+
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        if parent not in sys.path:
+            sys.path.insert(0, parent)
+
+        self.terrain_table = pd.DataFrame({
+            'CATEGORY': [774, 806, 898, 949, 1000, 1063],
+            'ROUGHNESS_LENGTH_m': [1, 0.4, 0.08, 0.04, 0.02, 0.006],
+            'SHIELDING': [100, 85, 100, 90, 100, 100]})
+
+    def test_mz_lookup(self):
+
+        from utilities.classification import mz_lookup
+
+        data = np.array([[1000, 1000, 949, 898],
+                         [898, 1063, 774, 949],
+                         [949, 12, 806, 806]])
+
+        expect_result = np.array([[0.8870, 0.8870, 0.8447, 0.8078],
+                                  [0.8078, 0.9802, 0.7037, 0.8447],
+                                  [0.8447, 0., 0.7372, 0.7372]])
+
+        for dtype in [np.uint16, np.int16, np.int32, np.float64]:
+            scripts_result = mz_lookup(self.terrain_table).reclassify(
+                data.astype(dtype))
+
+            self.assertEqual(scripts_result.dtype, np.float32)
+            assert_almost_equal(scripts_result, expect_result, decimal=3)
+
+    def test_ms_lookup(self):
+
+        from utilities.classification import ms_lookup
+
+        data = np.array([[806, 949, 7, 1063],
+                         [-99, 806, 774, 949]])
+
+        expect_result = np.array([[0.85, 0.9, 1., 1.],
+                                  [1., 0.85, 1., 0.9]])
+
+        for dtype in [np.int16, np.int64, np.float32]:
+            scripts_result = ms_lookup(self.terrain_table).reclassify(
+                data.astype(dtype))
+
+            assert_almost_equal(scripts_result, expect_result, decimal=5)
+
+    def test_lookup_table(self):
+
+        from utilities.classification import LookupTable
+
+        # repeated categories keep the last value, non-integer categories
+        # fall back to a search of the sorted categories
+        for categories in [[3, 1, 3], [3, 1.5, 3]]:
+            table = LookupTable(categories, [0.1, 0.2, 0.3], -1.)
+            data = np.array([[3, 1.5, 1], [np.nan, 2, 3]])
+            scripts_result = table.reclassify(data)
+
+            expect_result = np.array([[0.3, -1., -1.], [-1., -1., 0.3]])
+            expect_result[0, 1 if 1.5 in categories else 2] = 0.2
+
+            assert_almost_equal(scripts_result, expect_result, decimal=5)
+
+    def test_load_terrain_table_missing(self):
+
+        from utilities.classification import load_terrain_table
+
+        # a missing terrain table stops the run
+        missing = os.path.join(os.path.dirname(__file__),
+                               'no_terrain_table.csv')
+        with self.assertRaises(SystemExit):
+            load_terrain_table(missing)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -105,6 +105,66 @@ class TestClip(unittest.TestCase):
 
         del dst_dataset, match_dataset
 
+    def test_reproject_extent(self):
+
+        lc = os.path.join(self.testdata_folder, "test_raster_lc.img")
+        match_ds = os.path.join(self.testdata_folder,
+                                "test_raster_clip_dem.img")
+
+        from all_multipliers import reproject_dataset
+
+        dst_file = os.path.join(self.testdata_folder,
+                                'test_raster_dem_lc_extent.img')
+
+        match_dataset = gdal.Open(match_ds)
+        match_geotrans = match_dataset.GetGeoTransform()
+
+        # a window of 5 x 4 cells starting 2 cells into the matched tile
+        extent = [match_geotrans[0] + 2 * match_geotrans[1],
+                  match_geotrans[3] + 2 * match_geotrans[5],
+                  match_geotrans[0] + 7 * match_geotrans[1],
+                  match_geotrans[3] + 6 * match_geotrans[5]]
+
+        reproject_dataset(lc, match_ds, dst_file, match_extent=extent)
+
+        dst_dataset = gdal.Open(dst_file)
+        dst_data = dst_dataset.GetRasterBand(1).ReadAsArray()
+
+        assert_almost_equal(dst_dataset.GetGeoTransform(),
+                            (extent[0], match_geotrans[1], 0,
+                             extent[1], 0, match_geotrans[5]))
+        self.assertEqual(dst_data.shape, (4, 5))
+
+        del dst_dataset, match_dataset
+        os.remove(dst_file)
+
+    def test_tile_halos(self):
+
+        dem = os.path.join(self.testdata_folder, "test_raster_clip_dem.img")
+
+        from all_multipliers import TileGrid
+
+        tg = TileGrid(0.01, dem)
+
+        # [west, north, east, south] cells read for each direction
+        self.assertEqual(tg.halos['terrain']['w'][1:], [0, 0, 0])
+        self.assertEqual(tg.halos['terrain']['se'][:2], [0, 0])
+        self.assertEqual(tg.halos['shielding']['n'][2:], [1, 1])
+        self.assertEqual(tg.halos['topographic']['e'][1::2], [1, 1])
+
+        for halos in tg.halos.values():
+            for halo in halos.values():
+                self.assertLessEqual(max(halo[0], halo[2]), tg.x_buffer)
+                self.assertLessEqual(max(halo[1], halo[3]), tg.y_buffer)
+
+        assert_almost_equal(tg.get_tile_extent_halo(0, [0, 0, 0, 0]),
+                            tg.get_tile_extent(0))
+
+        extents = tg.get_tile_extents_halo(0)
+        self.assertEqual(sorted(extents), ['shielding', 'terrain',
+                                           'topographic'])
+        self.assertEqual(len(extents['topographic']), 8)
+
 
 if __name__ == "__main__":
     unittest.main()
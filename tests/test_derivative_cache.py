@@ -0,0 +1,93 @@
+"""
+ Title: test_derivative_cache.py
+ Description: Unit testing module for derivative_cache.py
+"""
+
+import sys
+import os.path
+import shutil
+import tempfile
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from utilities.config import configparser as config
+
+
+class TestDerivativeCache(unittest.TestCase):
+
+    def setUp(self):
+
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        if parent not in sys.path:
+            sys.path.insert(0, parent)
+
+        self.output_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        config.set('Processing', 'derivative_cache', 'False')
+        shutil.rmtree(self.output_folder)
+
+    def test_get_key(self):
+
+        from utilities.derivative_cache import get_key
+
+        dem = np.arange(12, dtype=np.float32).reshape(3, 4)
+        geotransform = (145.0, 0.00025, 0, -42.0, 0, -0.00025)
+        key = get_key(dem, geotransform)
+
+        self.assertEqual(key, get_key(dem.copy(), geotransform))
+
+        # the values, type, shape and geometry are all part of the key
+        changed = dem.copy()
+        changed[1, 1] = 100.
+        self.assertNotEqual(key, get_key(changed, geotransform))
+        self.assertNotEqual(key, get_key(dem.astype(float), geotransform))
+        self.assertNotEqual(key, get_key(dem.reshape(4, 3), geotransform))
+        self.assertNotEqual(key, get_key(dem, (145.5,) + geotransform[1:]))
+
+    def test_load_save_arrays(self):
+
+        from utilities.derivative_cache import get_cache_folder, \
+            load_arrays, save_arrays
+
+        slope = np.random.rand(5, 6).astype(np.float32)
+        slope[2, 3] = np.nan
+        aspect = np.arange(30, dtype=np.uint8).reshape(5, 6) % 9 + 1
+
+        # the cache is disabled by default
+        config.set('Processing', 'derivative_cache', 'False')
+        self.assertIsNone(get_cache_folder(self.output_folder))
+        save_arrays(None, 'tile', 'key', {'slope': slope})
+        self.assertIsNone(load_arrays(None, 'tile', 'key'))
+
+        config.set('Processing', 'derivative_cache', 'True')
+        cache_folder = get_cache_folder(self.output_folder)
+        self.assertIsNone(load_arrays(cache_folder, 'tile', 'key'))
+
+        save_arrays(cache_folder, 'tile', 'key',
+                    {'slope': slope, 'aspect': aspect})
+        cached = load_arrays(cache_folder, 'tile', 'key')
+
+        assert_almost_equal(cached['slope'], slope)
+        self.assertEqual(cached['aspect'].dtype, np.uint8)
+        assert_almost_equal(cached['aspect'], aspect)
+        self.assertIsNone(load_arrays(cache_folder, 'tile', 'other'))
+
+        # an unreadable file is ignored
+        cache_file = os.path.join(cache_folder, 'tile_broken.npz')
+        with open(cache_file, 'w') as broken:
+            broken.write('not an archive')
+        self.assertIsNone(load_arrays(cache_folder, 'tile', 'broken'))
+
+
+if __name__ == "__main__":
+    unittest.main()
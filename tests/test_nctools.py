@@ -80,6 +80,16 @@ class TestNctools(unittest.TestCase):
 
             assert_almost_equal(expected, data_clip, decimal=2)
 
+    def test_clip_window(self):
+        from utilities.nctools import get_clip_window, expand_window
+
+        window = get_clip_window(145.0, 13.0, 0.3, 0.3,
+                                 [145.40, -13.40, 146.40, -14.40])
+        self.assertEqual(window, (slice(1, 4), slice(1, 4)))
+
+        self.assertEqual(expand_window(window, 2, (7, 5)),
+                         (slice(0, 6), slice(0, 5)))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -15,7 +15,8 @@ import unittest
 
 import numpy as np
 
-from utilities.parallel import attempt_parallel
+from utilities.parallel import attempt_parallel, map_threads, \
+    map_processes, shared_array, read_shared_array
 from parallel import attempt_parallel
 
 
@@ -59,6 +60,30 @@ class TestParallel(unittest.TestCase):
         np.testing.assert_almost_equal(results[0], np.array([2, 4, 6]),
                                        decimal=2, err_msg='', verbose=True)
 
+    def test_map_threads(self):
+        items = list(range(20))
+        for threads in [1, 4]:
+            results = list(map_threads(lambda x: x * x, items, threads))
+            assert results == [x * x for x in items]
+        assert list(map_threads(abs, [], 4)) == []
+
+    def test_map_processes(self):
+        items = list(range(-10, 10))
+        for processes in [1, 2]:
+            results = list(map_processes(abs, items, processes))
+            assert results == [abs(x) for x in items]
+        assert list(map_processes(abs, [], 2)) == []
+
+    def test_shared_array(self):
+        array = np.arange(30, dtype=np.float32).reshape(5, 6)
+        with shared_array(array) as shared:
+            values = read_shared_array(shared)
+            np.testing.assert_array_equal(values, array)
+            assert values.dtype == np.float32
+            window = (slice(1, 3), slice(2, 6))
+            np.testing.assert_array_equal(
+                read_shared_array(shared, window), array[window])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -80,6 +80,22 @@ class TestShieldingMultiplier(unittest.TestCase):
         assert_almost_equal(scripts_result, expect_result, decimal=2,
                             err_msg='', verbose=True)
 
+    def test_combine_nan(self):
+
+        from shielding.shield_mult import combine
+
+        ms_orig_array = np.array([[np.nan, 0.5, 0.95, np.nan]],
+                                 dtype=np.float32)
+        slope_array = np.array([[15., 15., 1., np.nan]])
+        aspect_array = np.array([[7, 7, 7, 7]])
+
+        # the factor is updated in place and NaN stays NaN on steep slopes
+        result = combine(ms_orig_array, slope_array, aspect_array, 'w')
+
+        self.assertIs(result, ms_orig_array)
+        assert_almost_equal(result, [[np.nan, 1., 0.9025, np.nan]],
+                            decimal=5)
+
     def test_combine_scenario(self):
 
         # A single line of elevation data to use in the tests:
@@ -340,7 +356,135 @@ class TestShieldingMultiplier(unittest.TestCase):
         assert_almost_equal(kernel_se, kernel_se_expect, decimal=2, err_msg='',
                             verbose=True)
 
-    def test_get_slope_aspect(self):
+    def test_blur_image_window(self):
+
+        from shielding.shield_mult import blur_image, kern_nw
+
+        np.random.seed(5)
+        data = np.random.rand(15, 12)
+        kernel = kern_nw(3)
+
+        # the window sees the cells of the image within the kernel radius and
+        # the constant 1.0 beyond the image edges
+        for window in [(slice(4, 11), slice(4, 8)),
+                       (slice(0, 6), slice(7, 12))]:
+            assert_almost_equal(blur_image(data, kernel, window=window),
+                                blur_image(data, kernel)[window], decimal=10)
+
+    def test_integral_blur(self):
+
+        from shielding import shield_mult
+
+        np.random.seed(7)
+        data = np.random.rand(16, 13).astype(np.float32)
+        data[3, 9] = np.nan
+
+        # every direction matches the dense convolution with its kernel,
+        # including the spread of NaN and the cells beyond the edges
+        for one_dir in ['w', 'e', 'n', 's', 'nw', 'ne', 'se', 'sw']:
+            for size in [1, 2, 4]:
+                kernel = getattr(shield_mult, 'kern_' + one_dir)(size)
+                for window in [None, (slice(4, 11), slice(2, 9))]:
+                    assert_almost_equal(
+                        shield_mult.integral_blur(data, one_dir, size,
+                                                  window=window),
+                        shield_mult.blur_image(data, kernel, window=window),
+                        decimal=6)
+
+    def test_image_spectrum(self):
+
+        from shielding import shield_mult
+
+        np.random.seed(9)
+        data = np.random.rand(14, 19).astype(np.float32)
+        data[8, 2] = np.nan
+
+        # one spectrum blurs the window by the kernels of all directions
+        for window in [None, (slice(3, 12), slice(0, 7))]:
+            spectrum = shield_mult.ImageSpectrum(data, 3, window)
+            for one_dir in ['w', 'e', 'n', 's', 'nw', 'ne', 'se', 'sw']:
+                kernel = getattr(shield_mult, 'kern_' + one_dir)(3)
+                assert_almost_equal(
+                    spectrum.blur(kernel),
+                    shield_mult.blur_image(data, kernel, window=window),
+                    decimal=6)
+
+    def test_get_kernel(self):
+
+        from shielding.shield_mult import get_kernel, kern_se
+
+        hits = get_kernel.cache_info().hits
+        kernel = get_kernel('se', 4)
+        assert_almost_equal(kernel, kern_se(4), decimal=10)
+        self.assertFalse(kernel.flags.writeable)
+
+        self.assertIs(get_kernel('se', 4), kernel)
+        self.assertEqual(get_kernel.cache_info().hits, hits + 1)
+
+    def test_get_shielding_engine(self):
+
+        from shielding.shield_mult import get_shielding_engine, \
+            CONVOLVE_MAX_KERNEL
+
+        config.set('Processing', 'shielding_engine', 'auto')
+        self.assertEqual(get_shielding_engine(CONVOLVE_MAX_KERNEL),
+                         'convolve')
+        self.assertEqual(get_shielding_engine(CONVOLVE_MAX_KERNEL + 1),
+                         'integral')
+
+        config.set('Processing', 'shielding_engine', 'fft')
+        self.assertEqual(get_shielding_engine(1), 'fft')
+
+        config.set('Processing', 'shielding_engine', 'dense')
+        self.assertRaises(ValueError, get_shielding_engine)
+
+        config.set('Processing', 'shielding_engine', 'auto')
+
+    def test_reclassify_aspect(self):
+
+        from shielding.shield_mult import reclassify_aspect
+
+        data = np.array([[0., 22.4, 22.5, 67.5, 112.5, 157.5],
+                         [202.5, 247.5, 292.5, 337.4, 337.5, 360.],
+                         [np.nan, -1., 361., 90., 180., 270.]])
+
+        expect_result = np.array([[1, 1, 2, 3, 4, 5],
+                                  [6, 7, 8, 8, 1, 1],
+                                  [9, 9, 9, 3, 5, 7]])
+
+        scripts_result = reclassify_aspect(data)
+
+        self.assertEqual(scripts_result.dtype, np.uint8)
+        assert_almost_equal(scripts_result, expect_result)
+
+    def test_slope_aspect_float32(self):
+
+        from scipy import ndimage
+        from shielding.shield_mult import slope_aspect
+
+        np.random.seed(11)
+        elevation = ndimage.gaussian_filter(np.random.rand(82, 62) * 3000.,
+                                            4).astype(np.float32) * 5.
+        elevation[30:34, 20:25] = np.nan
+        x_m_array = np.full((80, 60), 22.5, dtype=np.float32)
+        y_m_array = np.full((80, 60), 27.7, dtype=np.float32)
+        geotransform = (145., 0.00025, 0, -42., 0, -0.00025)
+        window = (slice(1, 81), slice(1, 61))
+
+        slope_64, aspect_64 = slope_aspect(elevation, geotransform,
+                                           x_m_array, y_m_array, window,
+                                           dtype=np.float64)
+        slope_32, aspect_32 = slope_aspect(elevation, geotransform,
+                                           x_m_array, y_m_array, window)
+
+        # the float32 path agrees with the float64 path within 0.001 degree
+        self.assertEqual(slope_32.dtype, np.float32)
+        self.assertEqual(aspect_32.dtype, np.uint8)
+        assert_array_almost_equal(slope_32, slope_64, decimal=3)
+        self.assertTrue(np.all(np.isnan(slope_32) == np.isnan(slope_64)))
+        self.assertTrue(np.all(aspect_32 == aspect_64))
+
+    def test_slope_aspect_dem(self):
 
         dem = os.path.join(self.testdata_folder, "dem_4_slope.img")
         slope_expect = os.path.join(self.testdata_folder, "slope.img")
@@ -354,9 +498,21 @@ class TestShieldingMultiplier(unittest.TestCase):
         dst_band = aspect_dataset.GetRasterBand(1)
         aspect_array_expect = dst_band.ReadAsArray()
 
-        from shielding.shield_mult import get_slope_aspect
+        from shielding.shield_mult import slope_aspect
+        from utilities.get_pixel_size_grid import get_pixel_size_grids
+
+        dem_dataset = gdal.Open(dem)
+        band = dem_dataset.GetRasterBand(1)
+        data = band.ReadAsArray()
+        elevation_array = data.astype(np.float32)
+        mask = data == band.GetNoDataValue()
+        elevation_array[mask] = np.nan
+        x_m_array, y_m_array = get_pixel_size_grids(dem_dataset)
+        window = (slice(0, data.shape[0]), slice(0, data.shape[1]))
 
-        slope_array, aspect_array = get_slope_aspect(dem)
+        slope_array, aspect_array = slope_aspect(
+            elevation_array, dem_dataset.GetGeoTransform(), x_m_array,
+            y_m_array, window, mask=mask)
 
         # Check shape and content of arrays:
         assert_array_almost_equal(slope_array, slope_array_expect, decimal=0,
@@ -365,36 +521,31 @@ class TestShieldingMultiplier(unittest.TestCase):
         assert_array_almost_equal(aspect_array, aspect_array_expect,
                                   decimal=-1, err_msg='', verbose=True)
 
-    def test_terrain_class2ms_orig(self):
+    def test_terrain_class2ms(self):
 
         config.set('inputValues', 'terrain_table',
                    os.path.join(self.testdata_folder,
                                 'terrain_classification.csv'))
 
-        terrain = os.path.join(self.testdata_folder, "lc_terrain.img")
+        terrain_ds = gdal.Open(os.path.join(self.testdata_folder,
+                                            "lc_terrain.img"))
+        band = terrain_ds.GetRasterBand(1)
 
         ms_orig_expect = os.path.join(self.testdata_folder,
                                       "lc_terrain_ms_expect.img")
-        ms_orig_dataset_expect = gdal.Open(ms_orig_expect)
-        dst_band = ms_orig_dataset_expect.GetRasterBand(1)
-        ms_orig_array_expect = dst_band.ReadAsArray()
+        ms_orig_array_expect = gdal.Open(ms_orig_expect).GetRasterBand(
+            1).ReadAsArray()
 
-        from shielding.shield_mult import terrain_class2ms_orig
+        from shielding.shield_mult import terrain_class2ms
 
-        ms_orig = terrain_class2ms_orig(terrain)
-        ms_orig_dataset = gdal.Open(ms_orig)
-        dst_band = ms_orig_dataset.GetRasterBand(1)
-        ms_orig_array = dst_band.ReadAsArray()
+        data = band.ReadAsArray()
+        ms_orig_array = terrain_class2ms(data,
+                                         data == band.GetNoDataValue())
 
-        # Check geographic transform:
-        assert_almost_equal(ms_orig_dataset_expect.GetGeoTransform(),
-                            ms_orig_dataset.GetGeoTransform(), decimal=2)
-
-        # Check shape and content of arrays:
         assert_array_almost_equal(ms_orig_array_expect, ms_orig_array,
                                   decimal=0, err_msg='', verbose=True)
 
-        del ms_orig_dataset_expect, ms_orig_dataset
+        del terrain_ds
 
 
 if __name__ == "__main__":
@@ -164,6 +164,53 @@ class TestTerrainMultiplier(unittest.TestCase):
 
             index += 1
 
+    def test_convo_prefix(self):
+
+        from terrain.terrain_mult import convo, convo_prefix
+
+        np.random.seed(1)
+        data = np.random.rand(13, 21).astype(np.float32)
+
+        dire = ['w', 'e', 'n', 's', 'nw', 'ne', 'se', 'sw']
+
+        for avg_width, lag_width in [(4, 2), (1, 0), (10, 3), (30, 30)]:
+            for one_dir in dire:
+                outdata = convo_prefix(one_dir, data, avg_width, lag_width)
+                expect = convo(one_dir, data, avg_width, lag_width)
+
+                assert_almost_equal(outdata, expect, decimal=5, err_msg='',
+                                    verbose=True)
+
+    def test_convo_family(self):
+
+        from terrain.terrain_mult import (convo, convo_family, DIRECTIONS,
+                                          DIRECTION_FAMILY, FAMILIES)
+
+        np.random.seed(3)
+        data = np.random.rand(23, 19).astype(np.float32)
+
+        widths = dict([('w', (4, 2)), ('e', (3, 1)), ('n', (5, 0)),
+                       ('s', None), ('nw', (2, 2)), ('ne', (3, 1)),
+                       ('se', (20, 1)), ('sw', (4, 0))])
+
+        # the whole tile, then only its core with the buffer read as upwind
+        # context
+        for window in [(slice(0, 23), slice(0, 19)),
+                       (slice(6, 17), slice(6, 13)),
+                       (slice(0, 5), slice(3, 19))]:
+            for family in FAMILIES:
+                outdata = convo_family(family, data, widths, window)
+
+                expect_dirs = [one_dir for one_dir in DIRECTIONS
+                               if DIRECTION_FAMILY[one_dir] == family and
+                               widths[one_dir] is not None]
+                self.assertEqual(sorted(outdata), sorted(expect_dirs))
+
+                for one_dir in expect_dirs:
+                    expect = convo(one_dir, data, *widths[one_dir])[window]
+                    assert_almost_equal(outdata[one_dir], expect, decimal=5,
+                                        err_msg='', verbose=True)
+
 
 if __name__ == "__main__":
     unittest.main()
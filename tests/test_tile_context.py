@@ -0,0 +1,146 @@
+"""
+ Title: test_tile_context.py
+ Description: Unit testing module for the TileContext class in
+ tile_context.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+from osgeo import gdal, osr
+
+
+def mem_dataset(data, geotransform, nodata):
+    """
+    Return an in-memory dataset of an array
+    """
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+
+    driver = gdal.GetDriverByName('MEM')
+    dataset = driver.Create('', data.shape[1], data.shape[0], 1,
+                            gdal.GDT_Float32 if data.dtype.kind == 'f'
+                            else gdal.GDT_Int32)
+    dataset.SetGeoTransform(geotransform)
+    dataset.SetProjection(srs.ExportToWkt())
+    band = dataset.GetRasterBand(1)
+    band.WriteArray(data)
+    band.SetNoDataValue(nodata)
+
+    return dataset
+
+
+class TestTileContext(unittest.TestCase):
+
+    def setUp(self):
+
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        if parent not in sys.path:
+            sys.path.insert(0, parent)
+
+        self.dem = np.arange(200, dtype=np.float32).reshape(10, 20)
+        self.dem[2, 3] = -9999
+        self.dem_ds = mem_dataset(self.dem, (145.0, 0.01, 0, -20.0, 0,
+                                             -0.01), -9999)
+
+        # the landcover covers the columns 2 to 17 and the rows 1 to 8
+        self.landcover = np.ones((8, 16), dtype=np.int32)
+        self.landcover[0, 0] = 0
+        self.lc_ds = mem_dataset(self.landcover, (145.02, 0.01, 0, -20.01, 0,
+                                                  -0.01), 0)
+
+        self.tile_info = ['e145.05s20.02', (145.0, -20.0, 145.2, -20.1),
+                          (145.05, -20.02, 145.15, -20.07)]
+
+    def test_tile_context(self):
+
+        from utilities.tile_context import TileContext
+
+        tile = TileContext(self.tile_info, 'output', self.dem_ds,
+                           self.lc_ds)
+
+        self.assertTrue(np.isnan(tile.dem[2, 3]))
+        self.assertEqual(np.argwhere(tile.dem_mask).tolist(), [[2, 3]])
+        self.assertEqual(np.argwhere(tile.landcover_mask).tolist(), [[0, 0]])
+
+        self.assertEqual((len(tile.lat), len(tile.lon)), (5, 10))
+        self.assertEqual(tile.x_m_array.shape, (10, 20))
+
+        self.assertEqual(tile.get_core_window(),
+                         (slice(2, 7), slice(5, 15)))
+        self.assertEqual(tile.get_core_window(tile.landcover_geotransform),
+                         (slice(1, 6), slice(3, 13)))
+
+        data, geotransform = tile.get_landcover((145.03, -20.02, 145.06,
+                                                 -20.04))
+        self.assertEqual(data.shape, (2, 3))
+        assert_almost_equal(geotransform, (145.03, 0.01, 0, -20.02, 0,
+                                           -0.01))
+
+        x_m_array, _ = tile.get_pixel_size_grids(tile.landcover_geotransform,
+                                                 tile.landcover.shape)
+        assert_almost_equal(x_m_array, tile.x_m_array[1:9, 2:18])
+
+        self.assertIsNone(tile.get_halo_extent('terrain'))
+        self.assertEqual(tile.get_output_file('terrain', '_mz_', 'w'),
+                         os.path.join('output', 'terrain',
+                                      'e145.05s20.02_mz_w.nc'))
+
+    def test_halo_layer(self):
+
+        from utilities.tile_context import TileContext
+
+        # the west halo reaches the west edge of the tile with buffer, the
+        # east halo one column east of the tile without buffer
+        halos = {'terrain': {'w': (145.0, -20.02, 145.15, -20.07),
+                             'e': (145.05, -20.02, 145.16, -20.07)}}
+        tile = TileContext(self.tile_info + [halos], 'output', self.dem_ds,
+                           self.lc_ds)
+
+        data, geotransform, window = tile.get_halo_layer(
+            tile.dem, tile.dem_geotransform, 'terrain', ['w'])
+        self.assertEqual(data.shape, (5, 15))
+        self.assertEqual(window, (slice(0, 5), slice(5, 15)))
+        assert_almost_equal(data[window], tile.dem[2:7, 5:15])
+
+        data, geotransform, window = tile.get_halo_layer(
+            tile.dem, tile.dem_geotransform, 'terrain', ['w', 'e'])
+        self.assertEqual(data.shape, (5, 16))
+        assert_almost_equal(geotransform, (145.0, 0.01, 0, -20.02, 0,
+                                           -0.01))
+        self.assertEqual(window, (slice(0, 5), slice(5, 15)))
+
+    def test_dem_key(self):
+
+        from utilities.tile_context import TileContext
+
+        tile = TileContext(self.tile_info, 'output', self.dem_ds,
+                           self.lc_ds)
+        key = tile.get_dem_key('topographic')
+
+        # the key follows the DEM, not the landcover
+        self.assertEqual(key, TileContext(self.tile_info, 'output',
+                                          self.dem_ds).get_dem_key(
+                                              'topographic'))
+        self.assertNotEqual(key, tile.get_dem_key('shielding'))
+
+        self.dem[5, 5] += 1.
+        dem_ds = mem_dataset(self.dem, (145.0, 0.01, 0, -20.0, 0, -0.01),
+                             -9999)
+        self.assertNotEqual(key, TileContext(self.tile_info, 'output',
+                                             dem_ds).get_dem_key(
+                                                 'topographic'))
+
+
+if __name__ == "__main__":
+    unittest.main()
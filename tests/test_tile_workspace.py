@@ -0,0 +1,120 @@
+"""
+ Title: test_tile_workspace.py
+ Description: Unit testing module for make_tile_workspace function in
+ all_multipliers.py
+"""
+
+import sys
+import os.path
+import shutil
+import tempfile
+import unittest
+from inspect import getfile, currentframe
+
+from utilities.config import configparser as config
+
+
+class LocalComm(object):
+    """
+    The communicator seen by the first of several MPI processes, the others
+    reporting whether they see the marker file
+    """
+
+    def __init__(self, size, visible):
+        self.size = size
+        self.rank = 0
+        self.visible = visible
+
+    def bcast(self, value, root=0):
+        return value
+
+    def allgather(self, value):
+        return [value] + self.visible[1:]
+
+    def barrier(self):
+        pass
+
+
+class TestTileWorkspace(unittest.TestCase):
+
+    def setUp(self):
+
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        if parent not in sys.path:
+            sys.path.insert(0, parent)
+
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        config.set('Processing', 'scratch_folder', '')
+        shutil.rmtree(self.folder)
+
+    def test_make_tile_workspace(self):
+
+        import all_multipliers
+
+        all_multipliers.output_folder = os.path.join(self.folder, 'output')
+
+        # the workspaces are in the output folder by default, one per tile
+        config.set('Processing', 'scratch_folder', '')
+        workspace = all_multipliers.make_tile_workspace('e145.0s42.0')
+        other = all_multipliers.make_tile_workspace('e145.0s42.0')
+
+        self.assertEqual(os.path.dirname(workspace),
+                         all_multipliers.output_folder)
+        self.assertTrue(os.path.basename(workspace).startswith(
+            'e145.0s42.0_'))
+        self.assertNotEqual(workspace, other)
+
+        scratch = os.path.join(self.folder, 'scratch')
+        config.set('Processing', 'scratch_folder', scratch)
+        workspace = all_multipliers.make_tile_workspace('e145.0s42.0')
+
+        self.assertEqual(os.path.dirname(workspace), scratch)
+        self.assertTrue(os.path.isdir(workspace))
+
+    def test_remove_tile_workspace(self):
+
+        import all_multipliers
+
+        scratch = os.path.join(self.folder, 'scratch')
+        config.set('Processing', 'scratch_folder', scratch)
+        workspace = all_multipliers.make_tile_workspace('e145.0s42.0')
+        open(os.path.join(workspace, 'e145.0s42.0_dem.img'), 'w').close()
+
+        # only the folders of the scratch folder are removed
+        self.assertRaises(ValueError, all_multipliers.remove_tile_workspace,
+                          scratch)
+        self.assertRaises(ValueError, all_multipliers.remove_tile_workspace,
+                          self.folder)
+        self.assertTrue(os.path.isdir(workspace))
+
+        all_multipliers.remove_tile_workspace(workspace)
+        self.assertFalse(os.path.exists(workspace))
+        self.assertTrue(os.path.isdir(scratch))
+
+    def test_check_scratch_folder(self):
+
+        import all_multipliers
+
+        scratch = os.path.join(self.folder, 'scratch')
+        config.set('Processing', 'scratch_folder', scratch)
+
+        # the first process creates the marker, which a process on another
+        # node does not see with a local scratch folder
+        all_multipliers.check_scratch_folder(LocalComm(2, [True, True]))
+        self.assertEqual(os.listdir(scratch), [])
+
+        self.assertRaises(OSError, all_multipliers.check_scratch_folder,
+                          LocalComm(3, [True, False, True]))
+        self.assertEqual(os.listdir(scratch), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
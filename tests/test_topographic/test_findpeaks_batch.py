@@ -0,0 +1,97 @@
+"""
+    Title: test_findpeaks_batch.py
+    Description: Unit testing module for findpeaks_batch,
+                 findvalleys_batch and find_extrema_batch functions in
+                 findpeaks.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+
+
+class TestFindpeaksBatch(unittest.TestCase):
+
+    def setUp(self):
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        grandparent = os.path.abspath(os.path.join(parent, os.pardir))
+
+        if grandparent not in sys.path:
+            sys.path.insert(0, grandparent)
+
+    def assert_batch(self, lines):
+        """
+        Compare the batch detection with the detection of each line
+        """
+
+        from topographic.findpeaks import findpeaks, findvalleys, \
+            findpeaks_batch, findvalleys_batch, find_extrema_batch
+
+        lengths = np.array([np.size(line) for line in lines])
+        batch = np.full((len(lines), lengths.max() + 1), -999.)
+        for row, line in enumerate(lines):
+            batch[row, :lengths[row]] = line
+
+        ridge_line, ridge_ind = findpeaks_batch(batch, lengths)
+        valley_line, valley_ind = findvalleys_batch(batch, lengths)
+        along, backwards = find_extrema_batch(batch, lengths)
+
+        for row, line in enumerate(lines):
+            self.assertEqual(ridge_ind[ridge_line == row].tolist(),
+                             np.asarray(findpeaks(line)).tolist())
+            self.assertEqual(valley_ind[valley_line == row].tolist(),
+                             findvalleys(line).tolist())
+            self.assertEqual(np.nonzero(along[0][row])[0].tolist(),
+                             np.asarray(findpeaks(line)).tolist())
+            self.assertEqual(np.nonzero(along[1][row])[0].tolist(),
+                             findvalleys(line).tolist())
+
+            # the ridges and valleys of the line walked backwards, on the
+            # cells of the line
+            size = np.size(line)
+            self.assertEqual(
+                sorted(size - 1 - np.nonzero(backwards[0][row])[0]),
+                np.asarray(findpeaks(line[::-1])).tolist())
+            self.assertEqual(
+                sorted(size - 1 - np.nonzero(backwards[1][row])[0]),
+                findvalleys(line[::-1]).tolist())
+
+        return ridge_line
+
+    def test_engineered_lines(self):
+
+        from tests.test_topographic.test_all_topo_engineered_data \
+            import test_line, expect_results
+
+        lines = [np.floor(test_line[p]) for p in range(1, len(test_line) + 1)]
+        ridge_line = self.assert_batch(lines + [line[::-1] for line in lines])
+
+        # the number of hills of each line as in findpeaks.py
+        hill_no = np.bincount(ridge_line, minlength=2 * len(lines))
+        for p in range(1, len(test_line) + 1):
+            self.assertEqual(hill_no[p - 1], expect_results[p][0])
+
+    def test_plateaus(self):
+
+        # plateaus at the start, the end and along slopes, flat lines and
+        # lines of one or two cells
+        lines = [[5, 5, 6, 4], [5, 5, 4, 6], [1, 3, 3], [3, 1, 1],
+                 [1, 2, 2, 3], [3, 2, 2, 1], [2, 2, 2], [7], [1, 2], [2, 1],
+                 [1, 1], [0, 3, 3, 0, 0, 3, 3, 0]]
+        self.assert_batch([np.array(line, dtype=float) for line in lines])
+
+        rng = np.random.RandomState(0)
+        self.assert_batch([rng.randint(0, 3, size=size).astype(float)
+                           for size in rng.randint(1, 12, size=200)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+    Title: test_make_path.py
+    Description: Unit testing module for make_path and make_paths
+                 functions in make_path.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+
+
+class TestMakePath(unittest.TestCase):
+
+    def setUp(self):
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        grandparent = os.path.abspath(os.path.join(parent, os.pardir))
+
+        if grandparent not in sys.path:
+            sys.path.insert(0, grandparent)
+
+    def test_make_path(self):
+
+        from topographic.make_path import make_path
+
+        nr, nc = 4, 3
+
+        # the indices are 1-d indices of the columns stacked one after another
+        self.assertEqual(list(make_path(nr, nc, 4, 'n')), [4, 5, 6, 7])
+        self.assertEqual(list(make_path(nr, nc, 7, 's')), [7, 6, 5, 4])
+        self.assertEqual(list(make_path(nr, nc, 1, 'w')), [1, 5, 9])
+        self.assertEqual(list(make_path(nr, nc, 9, 'e')), [9, 5, 1])
+        self.assertEqual(list(make_path(nr, nc, 0, 'nw')), [0, 5, 10])
+        self.assertEqual(list(make_path(nr, nc, 11, 'se')), [11, 6, 1])
+        self.assertEqual(list(make_path(nr, nc, 3, 'sw')), [3, 6, 9])
+        self.assertEqual(list(make_path(nr, nc, 8, 'ne')), [8, 5, 2])
+
+    def test_make_paths(self):
+
+        from topographic.make_path import make_path, make_paths, \
+            get_path_set
+
+        nr, nc = 7, 5
+
+        for direction in ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw']:
+            paths = list(make_paths(nr, nc, direction))
+
+            # each cell is on exactly one path
+            cells = np.sort(np.concatenate([path for _, path in paths]))
+            self.assertEqual(cells.tolist(), list(range(nr * nc)))
+
+            for idx, path in paths:
+                self.assertEqual(path.tolist(),
+                                 list(make_path(nr, nc, idx, direction)))
+
+            # the path set is built once for a size and direction
+            self.assertIs(get_path_set(nr, nc, direction),
+                          get_path_set(nr, nc, direction))
+
+    def test_get_path_cells(self):
+
+        from topographic.make_path import make_paths, get_path_cells
+
+        nr, nc = 4, 6
+
+        for direction in ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw']:
+            cells, valid = get_path_cells(nr, nc, direction)
+            paths = list(make_paths(nr, nc, direction))
+
+            # each row holds a path, padded after its end
+            self.assertEqual(cells.shape[0], len(paths))
+            for row, (idx, path) in enumerate(paths):
+                self.assertEqual(cells[row, valid[row]].tolist(),
+                                 path.tolist())
+                self.assertTrue(valid[row, :path.size].all())
+                self.assertTrue(np.all(cells[row, ~valid[row]] == idx))
+
+            # a batch of the paths is cut after the longest of them
+            batch_cells, batch_valid = get_path_cells(nr, nc, direction,
+                                                      slice(2, 4))
+            width = valid[2:4].sum(axis=1).max()
+            self.assertEqual(batch_cells.tolist(),
+                             cells[2:4, :width].tolist())
+            self.assertEqual(batch_valid.tolist(),
+                             valid[2:4, :width].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+    Title: test_mh.py
+    Description: Unit testing module for mh_calc, mh_span and hilly_lines
+                 functions in mh.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+
+def mh_loop(profile, ridge, valley, data_spacing):
+    """
+    The topographic multiplier of a hill evaluated one cell at a time
+    """
+
+    from topographic.mh import escarpment_factor
+
+    z = 10
+    nrow = np.size(profile)
+    m = np.ones((nrow, 1), dtype=float)
+
+    h = profile[ridge] - profile[valley]
+    lu = abs(ridge - valley) * data_spacing / 2
+    slope = h / (2 * lu)
+    l1_capital = np.maximum(0.36 * lu, 0.4 * h)
+    l2_capital = 4 * l1_capital
+
+    escarp_factor = escarpment_factor(profile, ridge, valley, data_spacing)
+    fl2_ind = np.maximum(0, ridge - np.floor(l2_capital / data_spacing))
+    if slope < 0.05 or h < 10 or lu < data_spacing:
+        return m
+
+    l1 = int(np.floor(fl2_ind)) - 1
+    l2 = int(np.floor(np.minimum(nrow - 1, ridge + np.floor(
+        escarp_factor * l2_capital / data_spacing)) + 1))
+
+    for k in range(l1, l2):
+        x = (ridge - k) * data_spacing
+        if x >= 0 and x < l2_capital:
+            m[k] = min(1 + (h / (3.5 * (z + l1_capital))) *
+                       (1 - abs(x) / l2_capital), 1.71)
+        elif ((slope > 0.45) and (x < 0) and (x > -h / 4) and
+              (abs(escarp_factor - 1) < 0.2)):
+            m[k] = 1 + 0.71 * (1 - abs(x) / (escarp_factor * l2_capital))
+        elif x < 0 and x > -escarp_factor * l2_capital:
+            m[k] = min(1 + (h / (3.5 * (z + l1_capital))) *
+                       (1 - abs(x) / (escarp_factor * l2_capital)), 1.71)
+
+    return m
+
+
+class TestMh(unittest.TestCase):
+
+    def setUp(self):
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        grandparent = os.path.abspath(os.path.join(parent, os.pardir))
+
+        if grandparent not in sys.path:
+            sys.path.insert(0, grandparent)
+
+        self.data_spacing = 25
+
+    def test_mh_calc(self):
+
+        from tests.test_topographic.test_all_topo_engineered_data \
+            import test_line
+        from topographic.mh import mh_calc
+        from topographic.multiplier_calc import get_hills
+
+        rng = np.random.RandomState(0)
+        lines = list(test_line.values())
+        lines += [line[::-1] for line in lines]
+        lines += [np.cumsum(rng.randn(150) * 20) for _ in range(5)]
+
+        for line in lines:
+            fwd_line = np.floor(line)
+            for ridge, valley in zip(*get_hills(fwd_line)):
+                assert_array_equal(
+                    mh_calc(fwd_line, ridge, valley, self.data_spacing),
+                    mh_loop(fwd_line, ridge, valley, self.data_spacing))
+
+    def test_mh_span(self):
+
+        from topographic.mh import mh_span
+
+        # a hill at the start of the line, whose span starts at index -1
+        # and writes the last cell of the line
+        line = np.zeros(30)
+        line[2:5] = [40, 80, 40]
+        cells, values = mh_span(line, 3, 0, self.data_spacing)
+
+        self.assertEqual(cells[0], 29)
+        self.assertEqual(cells[1:].tolist(), list(range(cells.size - 1)))
+        m = mh_loop(line, 3, 0, self.data_spacing)
+        assert_array_equal(values, m[cells, 0])
+
+    def test_hilly_lines(self):
+
+        from topographic.mh import hilly_lines
+
+        rng = np.random.RandomState(0)
+        lengths = rng.randint(1, 60, size=200)
+        lines = np.zeros((lengths.size, 60))
+        for line, length in enumerate(lengths):
+            # from flat lines to steep ones
+            lines[line, :length] = np.floor(np.cumsum(
+                rng.randn(length) * line / 40 + line / 100))
+        # the padding is not part of the lines
+        lines[~(np.arange(60) < lengths[:, None])] = 1000.
+
+        ranges = hilly_lines(lines, lengths, self.data_spacing)
+        pyramid = hilly_lines(lines, lengths, self.data_spacing, True)
+
+        for line, length in enumerate(lengths):
+            profile = lines[line, :length]
+            # any pair of cells high and steep enough for mh_calc
+            d = np.abs(np.subtract.outer(np.arange(length),
+                                         np.arange(length)))
+            h = np.subtract.outer(profile, profile)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = h / (d * self.data_spacing)
+            hill = np.any((d >= 2) & (h >= 10) & (slope >= 0.05))
+
+            self.assertEqual(ranges[line], np.ptp(profile) >= 10)
+            if hill:
+                self.assertTrue(pyramid[line])
+            self.assertLessEqual(pyramid[line], ranges[line])
+
+        # some lines are pruned by the pyramid only
+        self.assertTrue(np.any(ranges & ~pyramid))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+    Title: test_multiplier_batch.py
+    Description: Unit testing module for multiplier_batch,
+                 multiplier_batch_pair and multiplier_sweep functions in
+                 multiplier_calc.py and the batches of lines of
+                 multiplier_batch in topo_mult.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+
+class TestMultiplierBatch(unittest.TestCase):
+
+    def setUp(self):
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        grandparent = os.path.abspath(os.path.join(parent, os.pardir))
+
+        if grandparent not in sys.path:
+            sys.path.insert(0, grandparent)
+
+        self.data_spacing = 25
+
+    def test_multiplier_batch(self):
+
+        from tests.test_topographic.test_all_topo_engineered_data \
+            import test_line
+        from topographic.multiplier_calc import multiplier_calc, \
+            multiplier_batch
+
+        # the engineered lines, reversed and cut short, and rugged lines
+        rng = np.random.RandomState(0)
+        lines = list(test_line.values())
+        lines += [line[::-1] for line in lines] + [line[:40] for line in lines]
+        lines += [rng.rand(size) * 200 for size in (1, 2, 3, 50, 120)]
+        lines += [np.cumsum(rng.randn(150) * 20) for _ in range(5)]
+
+        lengths = np.array([np.size(line) for line in lines])
+        batch = np.zeros((len(lines), lengths.max()))
+        for row, line in enumerate(lines):
+            batch[row, :np.size(line)] = line
+
+        m_batch = multiplier_batch(batch, lengths, self.data_spacing)
+
+        for row, line in enumerate(lines):
+            assert_array_equal(m_batch[row, :lengths[row]],
+                               multiplier_calc(line, self.data_spacing)[:, 0])
+            self.assertTrue(np.all(m_batch[row, lengths[row]:] == 1))
+
+    def test_multiplier_batch_pair(self):
+
+        from topographic.multiplier_calc import multiplier_calc, \
+            multiplier_batch_pair
+
+        rng = np.random.RandomState(2)
+        lines = [rng.rand(size) * 200 for size in (1, 2, 3, 50, 120)]
+        lines += [np.cumsum(rng.randn(size) * 20) for size in (80, 150)]
+        lines += [np.round(rng.rand(60) * 4) * 15]
+
+        lengths = np.array([np.size(line) for line in lines])
+        batch = np.zeros((len(lines), lengths.max()))
+        for row, line in enumerate(lines):
+            batch[row, :np.size(line)] = line
+
+        m_along, m_back = multiplier_batch_pair(batch, lengths,
+                                                self.data_spacing)
+
+        # the lines walked backwards give the multiplier of the opposite
+        # direction, laid on the cells of the lines
+        for row, line in enumerate(lines):
+            assert_array_equal(m_along[row, :lengths[row]],
+                               multiplier_calc(line, self.data_spacing)[:, 0])
+            assert_array_equal(
+                m_back[row, :lengths[row]],
+                multiplier_calc(line[::-1], self.data_spacing)[::-1, 0])
+            self.assertTrue(np.all(m_back[row, lengths[row]:] == 1))
+
+    def test_multiplier_sweep(self):
+
+        from tests.test_topographic.test_all_topo_engineered_data \
+            import test_line
+        from topographic.multiplier_calc import multiplier_calc, \
+            multiplier_sweep
+
+        rng = np.random.RandomState(1)
+        lines = list(test_line.values())
+        lines += [line[::-1] for line in lines]
+        lines += [rng.rand(size) * 200 for size in (1, 2, 3, 50, 120)]
+        lines += [np.cumsum(rng.randn(150) * 20) for _ in range(5)]
+
+        for line in lines:
+            assert_array_equal(multiplier_sweep(line, self.data_spacing),
+                               multiplier_calc(line, self.data_spacing))
+
+    def test_multiplier_sweep_overlapping(self):
+
+        from topographic import mh
+        from topographic.multiplier_calc import multiplier_calc, \
+            multiplier_sweep, get_hills
+
+        # rugged lines of high hills, whose zones overlap over many sweep
+        # blocks, starting at the foot of the line or running past its end
+        rng = np.random.RandomState(4)
+        lines = []
+        for size in (60, 500, 3000):
+            cells = np.arange(size)
+            lines.append(300 * np.sin(cells / 7.) +
+                         np.cumsum(rng.randn(size) * 10) +
+                         rng.rand(size) * 40)
+            lines.append(np.abs(np.cumsum(rng.randn(size) * 40)) % 500)
+            lines.append(lines[-1][::-1])
+
+        active, wrapped = 0, False
+        for line in lines:
+            assert_array_equal(multiplier_sweep(line, self.data_spacing),
+                               multiplier_calc(line, self.data_spacing))
+
+            fwd_line = np.floor(line)
+            ridge, valley = get_hills(fwd_line)
+            zones = mh.hill_zones(fwd_line[np.newaxis, :],
+                                  np.array([fwd_line.size]),
+                                  np.zeros(ridge.size, dtype=int), ridge,
+                                  valley, self.data_spacing)
+            first, end = np.maximum(zones[-2], 0), zones[-1]
+            active = max(active, np.cumsum(
+                np.bincount(first, minlength=fwd_line.size + 1) -
+                np.bincount(end, minlength=fwd_line.size + 1)).max())
+            wrapped |= bool(np.any(zones[-2] < 0))
+
+        self.assertGreater(active, 3)
+        self.assertTrue(wrapped)
+
+if __name__ == "__main__":
+    unittest.main()
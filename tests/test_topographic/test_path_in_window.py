@@ -0,0 +1,64 @@
+"""
+    Title: test_path_in_window.py
+    Description: Unit testing module for path_in_window function in
+                 topomult.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+
+class TestPathInWindow(unittest.TestCase):
+
+    def setUp(self):
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        grandparent = os.path.abspath(os.path.join(parent, os.pardir))
+
+        if grandparent not in sys.path:
+            sys.path.insert(0, grandparent)
+
+    def test_path_in_window(self):
+
+        from topographic.make_path import make_path
+        from topographic.topo_mult import path_in_window
+
+        nr, nc = 6, 5
+        window = (slice(2, 4), slice(1, 3))
+
+        # columns 1 and 2 cross the window going north, column 0 does not
+        crossing = [path_in_window(make_path(nr, nc, idx, 'n'), nr, window)
+                    for idx in range(0, nr * nc, nr)]
+        self.assertEqual(crossing, [False, True, True, False, False])
+
+        # the diagonal from the top left corner crosses (2, 2)
+        self.assertTrue(path_in_window(make_path(nr, nc, 0, 'nw'), nr,
+                                       window))
+        # the diagonal from (0, 3) leaves the window to its right
+        self.assertFalse(path_in_window(make_path(nr, nc, 3 * nr, 'nw'), nr,
+                                        window))
+
+    def test_paths_in_window(self):
+
+        from topographic.make_path import make_paths, get_path_cells
+        from topographic.topo_mult import path_in_window, paths_in_window
+
+        nr, nc = 6, 5
+        window = (slice(2, 4), slice(1, 3))
+
+        for direction in ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw']:
+            cells, valid = get_path_cells(nr, nc, direction)
+            crossing = [path_in_window(path, nr, window)
+                        for _, path in make_paths(nr, nc, direction)]
+            self.assertEqual(
+                paths_in_window(cells, valid, nr, window).tolist(), crossing)
+
+
+if __name__ == "__main__":
+    unittest.main()
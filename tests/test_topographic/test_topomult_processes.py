@@ -0,0 +1,67 @@
+"""
+    Title: test_topomult_processes.py
+    Description: Unit testing module for topomult_processes function in
+                 topomult.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+
+class TestTopomultProcesses(unittest.TestCase):
+
+    def setUp(self):
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        grandparent = os.path.abspath(os.path.join(parent, os.pardir))
+
+        if grandparent not in sys.path:
+            sys.path.insert(0, grandparent)
+
+        from tests.test_tile_context import mem_dataset
+
+        rng = np.random.RandomState(0)
+        dem = (np.cumsum(rng.rand(30, 40) * 30, axis=0) +
+               400).astype(np.float32)
+        dem[12, 15] = -9999
+        self.dem_ds = mem_dataset(dem, (145.0, 0.001, 0, -20.0, 0, -0.001),
+                                  -9999)
+
+        self.tile_info = ['e145.005s20.005', (145.0, -20.0, 145.04, -20.03),
+                          (145.005, -20.005, 145.035, -20.025)]
+
+    def test_topomult_processes(self):
+
+        from utilities.tile_context import TileContext
+        from topographic.topo_mult import get_direction_groups, \
+            topomult_directions, topomult_processes
+
+        tile = TileContext(self.tile_info, 'output', self.dem_ds)
+        cellsize = 100.
+
+        for engine in ['batch', 'sweep']:
+            groups = get_direction_groups(tile, engine)
+            expected = [result for directions in groups
+                        for result in topomult_directions(
+                            directions, tile, cellsize, engine)]
+            results = list(topomult_processes(groups, tile, cellsize,
+                                              engine, False, 2))
+
+            self.assertEqual([result[0] for result in results],
+                             [result[0] for result in expected])
+            for result, expected_result in zip(results, expected):
+                assert_array_equal(result[1], expected_result[1])
+                self.assertEqual(result[2], expected_result[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
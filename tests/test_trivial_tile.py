@@ -0,0 +1,104 @@
+"""
+ Title: test_trivial_tile.py
+ Description: Unit testing module for get_trivial_multipliers function in
+ all_multipliers.py
+"""
+
+import sys
+import os.path
+import unittest
+from inspect import getfile, currentframe
+
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from utilities.config import configparser as config
+
+
+class TestTrivialTile(unittest.TestCase):
+
+    def setUp(self):
+
+        cmd_folder = os.path.realpath(os.path.abspath(
+                                      os.path.split(getfile(
+                                                    currentframe()))[0]))
+
+        self.testdata_folder = os.path.join(cmd_folder, 'test_data')
+
+        parent = os.path.abspath(os.path.join(cmd_folder, os.pardir))
+
+        if parent not in sys.path:
+            sys.path.insert(0, parent)
+
+        config.set('inputValues', 'terrain_table',
+                   os.path.join(self.testdata_folder,
+                                'terrain_classification.csv'))
+
+        self.geotransform = (120.0, 0.00025, 0, -20.0, 0, -0.00025)
+
+    def test_trivial_tile(self):
+
+        from all_multipliers import get_trivial_multipliers
+
+        lc_data = np.ones((20, 30), dtype=np.int32)
+        dem_data = np.full((20, 30), 600.)
+
+        values = get_trivial_multipliers(dem_data, np.isnan(dem_data),
+                                         lc_data, lc_data == 0,
+                                         self.geotransform)
+
+        # city buildings: roughness length 2 m, shielding 85 %
+        assert_almost_equal(values['Mz'], 0.6808, decimal=4)
+        assert_almost_equal(values['Ms'], 0.85 * 0.9, decimal=4)
+        assert_almost_equal(values['Mt'], 1.0, decimal=4)
+
+        # the Tasmania factor applies to a flat tile above 500 m
+        values = get_trivial_multipliers(dem_data, np.isnan(dem_data),
+                                         lc_data, lc_data == 0,
+                                         (145.0, 0.00025, 0, -41.0, 0,
+                                          -0.00025))
+        assert_almost_equal(values['Mt'], 1.09, decimal=4)
+
+    def test_trivial_tile_nodata(self):
+
+        from all_multipliers import get_trivial_multipliers
+
+        lc_data = np.zeros((20, 30), dtype=np.int32)
+        dem_data = np.full((20, 30), np.nan)
+
+        values = get_trivial_multipliers(dem_data, np.isnan(dem_data),
+                                         lc_data, lc_data == 0,
+                                         self.geotransform)
+
+        self.assertIsNone(values['Mz'])
+        self.assertTrue(np.isnan(values['Ms']))
+        self.assertTrue(np.isnan(values['Mt']))
+
+    def test_not_trivial_tile(self):
+
+        from all_multipliers import get_trivial_multipliers
+
+        lc_data = np.ones((20, 30), dtype=np.int32)
+        dem_data = np.full((20, 30), 10.)
+
+        dem_relief = dem_data.copy()
+        dem_relief[5, 5] = 11.
+        self.assertIsNone(get_trivial_multipliers(
+            dem_relief, np.isnan(dem_relief), lc_data, lc_data == 0,
+            self.geotransform))
+
+        dem_hole = dem_data.copy()
+        dem_hole[5, 5] = np.nan
+        self.assertIsNone(get_trivial_multipliers(
+            dem_hole, np.isnan(dem_hole), lc_data, lc_data == 0,
+            self.geotransform))
+
+        lc_mixed = lc_data.copy()
+        lc_mixed[0, 0] = 2
+        self.assertIsNone(get_trivial_multipliers(
+            dem_data, np.isnan(dem_data), lc_mixed, lc_mixed == 0,
+            self.geotransform))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -84,3 +84,155 @@ def findvalleys(y):
     valley = np.size(y) - ind - 1
     valley = np.flipud(valley)
     return valley
+
+
+def findpeaks_batch(y, lengths):
+    """
+    Generate the indices of the peaks in many data lines at once, as
+    :func:`findpeaks` does for each line
+
+    :param y: :class:`numpy.ndarray` the elevation of each line in a row,
+              padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+
+    :return: :class:`numpy.ndarray` the line and
+             :class:`numpy.ndarray` the index value of each ridge, sorted by
+             line and index
+    """
+
+    steps = line_steps(y, lengths)
+
+    return np.nonzero(extrema_masks(steps, steps['rise'], 1)[0])
+
+
+def findvalleys_batch(y, lengths):
+    """
+    Generate the indices of the valleys in many data lines at once, as
+    :func:`findvalleys` does for each line
+
+    :param y: :class:`numpy.ndarray` the elevation of each line in a row,
+              padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+
+    :return: :class:`numpy.ndarray` the line and
+             :class:`numpy.ndarray` the index value of each valley, sorted by
+             line and index
+    """
+
+    steps = line_steps(y, lengths)
+
+    return np.nonzero(extrema_masks(steps, steps['rise'], 1)[1])
+
+
+def find_extrema_batch(y, lengths):
+    """
+    Generate the ridges and valleys of many data lines at once, both along
+    the lines and along the lines walked backwards, from one pass of
+    differences
+
+    :param y: :class:`numpy.ndarray` the elevation of each line in a row,
+              padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+
+    :return: `tuple` of :class:`numpy.ndarray` the masks of the ridges and
+             valleys of the lines, as :func:`findpeaks_batch` and
+             :func:`findvalleys_batch`, and `tuple` of
+             :class:`numpy.ndarray` the masks of the ridges and valleys of
+             the lines walked backwards, on the cells of the lines
+    """
+
+    steps = line_steps(y, lengths)
+
+    # walked backwards, the falls of a line are its rises, its valleys
+    # the ridges and its ridges the valleys
+    reverse_valleys, reverse_peaks = extrema_masks(steps, steps['fall'], -1)
+
+    return (extrema_masks(steps, steps['rise'], 1),
+            (reverse_peaks, reverse_valleys))
+
+
+def extrema_masks(steps, up, up_sign):
+    """
+    Locate the peaks and valleys of many data lines, the peaks the cells
+    reached by a rise and not followed by one, the start of their plateaus,
+    and the valleys the cells not reached by a rise and followed by one,
+    the end of their plateaus
+
+    :param steps: `dict` the steps of the lines from :func:`line_steps`
+    :param up: :class:`numpy.ndarray` the mask of the steps counted as
+               rises, the rises of the lines or their falls for the lines
+               negated
+    :param up_sign: `int` the sign of the steps counted as rises
+
+    :return: :class:`numpy.ndarray` the masks of the peaks and valleys
+    """
+
+    first, last = steps['first'], steps['last']
+    lengths = steps['lengths']
+
+    up_before = np.zeros(up.shape, dtype=bool)
+    up_before[:, 1:] = up[:, :-1]
+
+    # flat lines have neither peaks nor valleys
+    lines = steps['valid'] & steps['relief'][:, None]
+    peaks = lines & (first | up_before) & (last | ~up)
+    valleys = lines & (first | ~up_before) & (last | up)
+
+    # There is a plateau at the start, which is a valley if the line rises
+    # after it, so remove it from the list
+    peaks[:, 0] &= ~(steps['flat_start'] & (steps['first_step'] == up_sign))
+
+    # There is a plateau at the end, which is a peak if the line rises
+    # before it, so remove it from the list
+    rows = np.nonzero(lengths > 1)[0]
+    valleys[rows, lengths[rows] - 1] &= ~(
+        steps['flat_end'] & (steps['last_step'] == up_sign))[rows]
+
+    return peaks, valleys
+
+
+def line_steps(y, lengths):
+    """
+    Differentiate many data lines at once
+
+    :param y: :class:`numpy.ndarray` the elevation of each line in a row,
+              padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+
+    :return: `dict` the lengths of the lines, the masks of the cells on the
+             lines, of their first and of their last cells, of the rises
+             and falls to the next cells, of the lines with relief or a
+             single cell and of the lines starting and ending with a
+             plateau, and the signs of the first and last steps of the
+             lines that are not flat
+    """
+
+    cells = np.arange(y.shape[1])
+    rows = np.arange(y.shape[0])
+    valid = cells < lengths[:, None]
+    last = cells == lengths[:, None] - 1
+
+    dy = np.zeros(y.shape, dtype=y.dtype)
+    dy[:, :-1] = np.diff(y, axis=1)
+    dy[last | ~valid] = 0
+
+    rise = dy > 0
+    fall = dy < 0
+    step = rise | fall
+
+    flat_end = np.zeros(rows.shape, dtype=bool)
+    long_rows = lengths > 1
+    flat_end[long_rows] = ~step[long_rows, lengths[long_rows] - 2]
+
+    return {'lengths': lengths,
+            'valid': valid,
+            'first': cells[np.newaxis, :] == 0,
+            'last': last,
+            'rise': rise,
+            'fall': fall,
+            'relief': np.any(step, axis=1) | (lengths == 1),
+            'flat_start': ~step[:, 0] & long_rows,
+            'flat_end': flat_end,
+            'first_step': np.sign(dy[rows, np.argmax(step, axis=1)]),
+            'last_step': np.sign(dy[rows, y.shape[1] - 1 -
+                                    np.argmax(step[:, ::-1], axis=1)])}
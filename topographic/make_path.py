@@ -4,30 +4,23 @@
 
 This module is called by the module :term:`topomult`
 """
+from functools import lru_cache
+
 import numpy
 
 
-def make_path(nr, nc, n, dire):
+def get_increments(dire):
     """
-    Returns a vector of array indices for a path starting at index n in a
-    matrix of size nr by nc and proceeding in direction dir, where dir is one
-    of the 8 cardinal directions (n,s,e,w,ne,nw,se,sw).
-    Note that the array indices are all 1-d indices.
+    Returns the row and column increments of a path proceeding in direction
+    dir, starting from the boundary the wind comes from
 
-    :param nr: `int` number of rows of the input DEM
-    :param nc: `int` number of columns of the input DEM
-    :param n: `int` starting index
     :param dire: `string` direction of the path
 
-    :Returns: :class:`numpy.ndarray` the indices of a path
+    :Returns: `tuple` the row and column increments
     """
 
     dire = dire.lower()
 
-    # first compute the i,j coordinates from the 1-d index n
-    i = numpy.mod(n, nr) + 1
-    j = (n + 1 - i) / nr + 1
-
     # find the i and j increments according to
     # the directions in which we traverse
 
@@ -45,12 +38,159 @@ def make_path(nr, nc, n, dire):
     else:
         j_incr = 0
 
-    # traverse, putting the positions in 1-index form
-    result = []
-    while ((i <= nr and i >= 1) and (j <= nc and j >= 1)):
-        l = i + (j - 1) * nr - 1
-        result.append(int(l))
-        i += i_incr
-        j += j_incr
+    return i_incr, j_incr
+
+
+def get_path_length(nr, nc, row, col, dire):
+    """
+    Returns the number of cells of the paths starting at given positions in
+    a matrix of size nr by nc and proceeding in direction dir
+
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param row: `int` or :class:`numpy.ndarray` 0-based starting rows
+    :param col: `int` or :class:`numpy.ndarray` 0-based starting columns
+    :param dire: `string` direction of the path
+
+    :Returns: `int` or :class:`numpy.ndarray` the lengths of the paths
+    """
+
+    i_incr, j_incr = get_increments(dire)
+
+    # the path ends at the first boundary it reaches
+    length = numpy.full(numpy.shape(row), max(nr, nc))
+    if i_incr > 0:
+        length = numpy.minimum(length, nr - row)
+    elif i_incr < 0:
+        length = numpy.minimum(length, row + 1)
+    if j_incr > 0:
+        length = numpy.minimum(length, nc - col)
+    elif j_incr < 0:
+        length = numpy.minimum(length, col + 1)
+
+    # starting positions outside the matrix have no cells
+    inside = (row >= 0) & (row < nr) & (col >= 0) & (col < nc)
+
+    return numpy.where(inside, length, 0)
+
+
+def make_path(nr, nc, n, dire):
+    """
+    Returns a vector of array indices for a path starting at index n in a
+    matrix of size nr by nc and proceeding in direction dir, where dir is one
+    of the 8 cardinal directions (n,s,e,w,ne,nw,se,sw).
+    Note that the array indices are all 1-d indices.
+
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param n: `int` starting index
+    :param dire: `string` direction of the path
+
+    :Returns: :class:`numpy.ndarray` the indices of a path
+    """
+
+    # first compute the row and column from the 1-d index n
+    n = int(n)
+    row, col = n % nr, n // nr
+
+    i_incr, j_incr = get_increments(dire)
+    length = int(get_path_length(nr, nc, row, col, dire))
+
+    return n + numpy.arange(length) * (i_incr + j_incr * nr)
+
+
+@lru_cache(maxsize=64)
+def get_path_set(nr, nc, dire):
+    """
+    Returns the paths covering a matrix of size nr by nc in direction dir,
+    starting from the boundaries the wind comes from. The set is built once
+    per process for each matrix size and direction, and shared between the
+    tiles.
+
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param dire: `string` direction of the paths
+
+    :Returns: :class:`numpy.ndarray` the sorted starting indices,
+              :class:`numpy.ndarray` the lengths of the paths and
+              :class:`numpy.ndarray` the offsets of the cells of the longest
+              path from its starting index
+    """
+
+    dire = dire.lower()
+
+    # Compute the starting positions along the boundaries depending on dir
+    # Together, the direction and the starting position determines a line.
+    # Note that the starting positions are defined
+    # in terms of the 1-d index of the array.
+    strt_idx = []
+    if dire.find('n') >= 0:
+        strt_idx.append(numpy.arange(0, nr * nc, nr))
+    if dire.find('s') >= 0:
+        strt_idx.append(numpy.arange(nr - 1, nr * nc, nr))
+    if dire.find('e') >= 0:
+        strt_idx.append(numpy.arange((nc - 1) * nr, nr * nc))
+    if dire.find('w') >= 0:
+        strt_idx.append(numpy.arange(0, nr))
+
+    # For the diagonal directions the corner will have been counted twice
+    # so get rid of the duplicates
+    strt_idx = numpy.unique(numpy.concatenate(strt_idx))
+
+    lengths = get_path_length(nr, nc, strt_idx % nr, strt_idx // nr, dire)
+
+    i_incr, j_incr = get_increments(dire)
+    offsets = numpy.arange(lengths.max()) * (i_incr + j_incr * nr)
+
+    for values in (strt_idx, lengths, offsets):
+        values.setflags(write=False)
+
+    return strt_idx, lengths, offsets
+
+
+def make_paths(nr, nc, dire):
+    """
+    Generates the paths covering a matrix of size nr by nc in direction
+    dir, each as the vector of its array indices as :func:`make_path`
+    returns it, in the order of their starting indices
+
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param dire: `string` direction of the paths
+
+    :Returns: generator of `int` the starting index and
+              :class:`numpy.ndarray` the indices of each path
+    """
+
+    strt_idx, lengths, offsets = get_path_set(nr, nc, dire)
+
+    for idx, length in zip(strt_idx, lengths):
+        yield idx, idx + offsets[:length]
+
+
+def get_path_cells(nr, nc, dire, paths=slice(None)):
+    """
+    Returns the paths covering a matrix of size nr by nc in direction dir as
+    the rows of one 2-D array of 1-d indices, in the order of their starting
+    indices. The rows, columns or diagonals of the matrix are laid side by
+    side as in a skewed copy of it, each path padded after its end.
+
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param dire: `string` direction of the paths
+    :param paths: `slice` the paths returned, all of them by default
+
+    :Returns: :class:`numpy.ndarray` the 1-d indices of the cells of each
+              path, its starting index on the padding up to the longest of
+              the paths, and
+              :class:`numpy.ndarray` the mask of the cells on the paths
+    """
+
+    strt_idx, lengths, offsets = get_path_set(nr, nc, dire)
+    strt_idx, lengths = strt_idx[paths], lengths[paths]
+    offsets = offsets[:lengths.max(initial=0)]
+
+    valid = numpy.arange(offsets.size) < lengths[:, None]
+    cells = strt_idx[:, None] + numpy.where(valid, offsets, 0)
 
-    return result
+    return cells, valid
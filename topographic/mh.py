@@ -7,6 +7,16 @@ This module is called by the module :term:`multiplier_calc`
 
 import numpy as np
 
+# The largest number of cells the hills of a batch are expanded to at once
+MAX_SPAN_CELLS = 1 << 18
+
+# The hills lower or gentler than these do not change the multiplier
+H_THRESHOLD = 10
+SLOPE_THRESHOLD = 0.05
+
+# The number of cells a line is swept by at once in mh_sweep
+SWEEP_BLOCK = 64
+
 
 def escarpment_factor(profile, ridge, valley, data_spacing):
     """
@@ -61,16 +71,38 @@ def mh_calc(profile, ridge, valley, data_spacing):
     :return: :class:`numpy.ndarray` the topogrpahic multiplier of the line
     """
 
+    nrow = np.size(profile)
+    m = np.ones((nrow, 1), dtype=float)
+
+    cells, values = mh_span(profile, ridge, valley, data_spacing)
+    m[cells, 0] = values
+
+    return m
+
+
+def mh_span(profile, ridge, valley, data_spacing):
+    """
+    Calculate the topographic multiplier of a hill over the cells of the
+    line it affects
+
+    :param profile: :class:`numpy.ndarray` the elevation of a line
+    :param ridge: `int` the index of the ridge of the hill
+    :param valley: `int` the index of the valley of the hill
+    :param data_spacing: `float` distance between neighbour points of a line
+
+    :return: :class:`numpy.ndarray` the indices of the cells affected and
+             :class:`numpy.ndarray` their topographic multiplier
+    """
+
     # --------------------------------------------------------
     # initialise parameters
     # --------------------------------------------------------
 
-    h_threshold = 10     # height threshold for mh calculation
+    h_threshold = H_THRESHOLD     # height threshold for mh calculation
     lu_threshold = data_spacing    # half distance threshold for mh calculation
 
     z = 10  # building height
     nrow = np.size(profile)
-    m = np.ones((nrow, 1), dtype=float)
 
     h = profile[ridge] - profile[valley]
     lu = abs(ridge - valley) * data_spacing / 2
@@ -80,8 +112,8 @@ def mh_calc(profile, ridge, valley, data_spacing):
 
     escarp_factor = escarpment_factor(profile, ridge, valley, data_spacing)
     fl2_ind = np.maximum(0, ridge - np.floor(l2_capital / data_spacing))
-    if slope < 0.05 or h < h_threshold or lu < lu_threshold:
-        return m
+    if slope < SLOPE_THRESHOLD or h < h_threshold or lu < lu_threshold:
+        return np.empty(0, dtype=int), np.empty(0, dtype=float)
 
     # calculate the mh from the front l2_capital to the back l2_capital with
     # the escarpment factor considered:
@@ -98,36 +130,373 @@ def mh_calc(profile, ridge, valley, data_spacing):
                     data_spacing)) +
             1))
 
-    for k in range(l1, l2):
-        x = (ridge - k) * data_spacing
-
-        # within the region of l2_capital up to the ridge
-        if x >= 0 and x < l2_capital:
-            m[k] = 1 + (h / (3.5 * (z + l1_capital))) * (1 - abs(x) /
-                                                         l2_capital)
-
-            # --------------------------------------------------------
-            # for larger slopes, you still use the formula to calculate M,
-            # then re-value to 1.71 when it is larger. If use 1.71 for any
-            # slope greater than 0.45, then all the points within the
-            # l2_capital zone will have 1.71 rather than a gradual increasing,
-            # peaks and decreasing pattern.
-            # --------------------------------------------------------
-
-            if m[k] > 1.71:
-                m[k] = 1.71
-
-        # more or less a symmetrical hill
-        elif ((slope > 0.45) and (x < 0) and (x > -h / 4) and
-              (abs(escarp_factor - 1) < 0.2)):
-            m[k] = 1 + 0.71 * (1 - abs(x) / (escarp_factor * l2_capital))
-
-        # within the region from the ridge2 up to the back l2_capital
-        elif x < 0 and x > -escarp_factor * l2_capital:
-            m[k] = 1 + (h / (3.5 * (z + l1_capital))) * (1 - abs(x) /
-                                                         (escarp_factor *
-                                                          l2_capital))
-            if m[k] > 1.71:
-                m[k] = 1.71
+    cells = np.arange(l1, l2)
+    values, written = mh_values((ridge - cells) * data_spacing, h, slope,
+                                l1_capital, l2_capital, escarp_factor, z)
+
+    # a span starting at the foot of the line starts at index -1, which
+    # writes the last cell unless the span overwrites it
+    if l1 < 0:
+        cells[0] += nrow
+        if l2 == nrow and written[-1]:
+            written[0] = False
+
+    return cells[written], values[written]
+
+
+def mh_batch(profiles, lengths, line_ind, ridge, valley, data_spacing,
+             backwards=False):
+    """
+    Calculate the topographic multiplier of many hills of a batch of lines
+    at once, as the largest value of :func:`mh_calc` over the hills of each
+    line
+
+    :param profiles: :class:`numpy.ndarray` the elevation of each line in a
+                     row, padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+    :param line_ind: :class:`numpy.ndarray` the line of each hill
+    :param ridge: :class:`numpy.ndarray` the index of the ridge of each hill
+    :param valley: :class:`numpy.ndarray` the index of the valley of each hill
+    :param data_spacing: `float` distance between neighbour points of a line
+    :param backwards: `bool` True if the lines are walked backwards, the
+                      indices of the hills counting from the end of their
+                      lines
+
+    :return: :class:`numpy.ndarray` the topographic multiplier of the lines,
+             on their cells and 1 on the padding
+    """
+
+    z = 10  # building height
+    m = np.ones(profiles.shape, dtype=float)
+
+    hills = hill_zones(profiles, lengths, line_ind, ridge, valley,
+                       data_spacing, backwards)
+    if hills is None:
+        return m
+    line_ind, ridge, nrow, h, slope, l1_capital, l2_capital, \
+        escarp_factor, l1, l2 = hills
+
+    # the hills are expanded to their cells in groups of bounded size
+    counts = l2 - l1
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    group_ends = np.unique(np.append(np.searchsorted(
+        ends, np.arange(MAX_SPAN_CELLS, ends[-1], MAX_SPAN_CELLS),
+        side='right'), ends.size))
+    group_start = 0
+    for group_end in group_ends[group_ends > 0]:
+        hill = np.repeat(np.arange(group_start, group_end),
+                         counts[group_start:group_end])
+        k = l1[hill] + np.arange(starts[group_start],
+                                 ends[group_end - 1]) - starts[hill]
+        group_start = group_end
+
+        values, written = mh_values(
+            (ridge[hill] - k) * data_spacing, h[hill], slope[hill],
+            l1_capital[hill], l2_capital[hill], escarp_factor[hill], z)
+
+        # mh_calc starts the span of a hill at the foot of the line at
+        # index -1, which writes the last cell unless the span overwrites it
+        wrapped = np.nonzero(k < 0)[0]
+        overwritten = wrapped[l2[hill[wrapped]] == nrow[hill[wrapped]]]
+        written[overwritten] &= ~written[overwritten + nrow[
+            hill[overwritten]]]
+        k[wrapped] += nrow[hill[wrapped]]
+
+        cells = (line_ind[hill] * profiles.shape[1] +
+                 get_cells(k, nrow[hill], backwards))
+        np.maximum.at(m.reshape(-1), cells[written], values[written])
+
+    return m
+
+
+def hill_zones(profiles, lengths, line_ind, ridge, valley, data_spacing,
+               backwards=False):
+    """
+    Calculate the parameters and the zones of influence of many hills of a
+    batch of lines, keeping the hills high and steep enough to change the
+    multiplier, as :func:`mh_span` does for one hill
+
+    :param profiles: :class:`numpy.ndarray` the elevation of each line in a
+                     row, padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+    :param line_ind: :class:`numpy.ndarray` the line of each hill
+    :param ridge: :class:`numpy.ndarray` the index of the ridge of each hill
+    :param valley: :class:`numpy.ndarray` the index of the valley of each hill
+    :param data_spacing: `float` distance between neighbour points of a line
+    :param backwards: `bool` True if the lines are walked backwards
+
+    :return: `tuple` of :class:`numpy.ndarray` the line, ridge, line length,
+             height, slope, l1_capital, l2_capital and escarpment factor of
+             the hills kept, and the first and end indices of their zones,
+             or None if no hill is kept
+    """
+
+    h_threshold = H_THRESHOLD     # height threshold for mh calculation
+    lu_threshold = data_spacing    # half distance threshold for mh calculation
+
+    nrow = lengths[line_ind]
+    h = (profiles[line_ind, get_cells(ridge, nrow, backwards)] -
+         profiles[line_ind, get_cells(valley, nrow, backwards)])
+    lu = abs(ridge - valley) * data_spacing / 2
+    slope = h / (2 * lu)
+
+    # only the hills high and steep enough change the multiplier
+    keep = ~((slope < SLOPE_THRESHOLD) | (h < h_threshold) |
+             (lu < lu_threshold))
+    if not np.any(keep):
+        return None
+
+    line_ind, ridge, nrow, h, lu, slope = (
+        values[keep] for values in (line_ind, ridge, nrow, h, lu, slope))
+    l1_capital = np.maximum(0.36 * lu, 0.4 * h)
+    l2_capital = 4 * l1_capital
+
+    escarp_factor = escarpment_factors(profiles, line_ind, nrow, ridge, lu,
+                                       slope, data_spacing, backwards)
+
+    # the zone of each hill, from the front l2_capital to the back
+    # l2_capital with the escarpment factor considered, as in mh_calc
+    fl2_ind = np.maximum(0, ridge - np.floor(l2_capital / data_spacing))
+    l1 = np.floor(fl2_ind).astype(int) - 1
+    l2 = np.floor(np.minimum(nrow - 1, ridge + np.floor(
+        escarp_factor * l2_capital / data_spacing)) + 1).astype(int)
+
+    return (line_ind, ridge, nrow, h, slope, l1_capital, l2_capital,
+            escarp_factor, l1, l2)
+
+
+def mh_sweep(profile, ridge, valley, data_spacing):
+    """
+    Calculate the topographic multiplier of a line in one sweep along it,
+    as the largest value of :func:`mh_calc` over its hills. The line is
+    swept in blocks of `SWEEP_BLOCK` cells: the zone of a hill joins the set
+    of active hills at the block where it starts and leaves it after the
+    block where it ends, and each block takes the largest value of its
+    active hills. The work grows with the length of the line times the
+    number of hills active at once, not with the number of hills.
+
+    :param profile: :class:`numpy.ndarray` the elevation of a line
+    :param ridge: :class:`numpy.ndarray` the indices of the ridges of a line
+    :param valley: :class:`numpy.ndarray` the indices of the valleys of a line
+    :param data_spacing: `float` distance between neighbour points of a line
+
+    :return: :class:`numpy.ndarray` the topogrpahic multiplier of the line
+    """
+
+    z = 10  # building height
+    nrow = np.size(profile)
+    m = np.ones(nrow, dtype=float)
+
+    hills = hill_zones(profile[np.newaxis, :], np.array([nrow]),
+                       np.zeros(np.size(ridge), dtype=int), ridge, valley,
+                       data_spacing)
+    if hills is None:
+        return m
+    _, ridge, _, h, slope, l1_capital, l2_capital, escarp_factor, \
+        l1, l2 = hills
+
+    def hill_values(hill, k):
+        values, written = mh_values(
+            (ridge[hill, np.newaxis] - k) * data_spacing,
+            h[hill, np.newaxis], slope[hill, np.newaxis],
+            l1_capital[hill, np.newaxis], l2_capital[hill, np.newaxis],
+            escarp_factor[hill, np.newaxis], z)
+        return values, written
+
+    # the line is swept in blocks of cells, the zones joining the active
+    # hills in the order they start and leaving once they end. The cells out
+    # of the influence of an active hill take 1, which every multiplier
+    # exceeds
+    first = np.maximum(l1, 0)
+    order = np.argsort(first, kind='stable')
+    active = []
+    pushed = 0
+    for start in range(0, nrow, SWEEP_BLOCK):
+        end = min(start + SWEEP_BLOCK, nrow)
+        active = [hill for hill in active if l2[hill] > start]
+        while pushed < order.size and first[order[pushed]] < end:
+            active.append(order[pushed])
+            pushed += 1
+        if not active:
+            continue
+
+        values, written = hill_values(np.array(active),
+                                      np.arange(start, end))
+        m[start:end] = np.where(written, values, 1.).max(axis=0)
+
+    # mh_calc starts the zone of a hill at the foot of the line at index
+    # -1, which writes the last cell unless the zone overwrites it
+    wrapped = np.nonzero(l1 < 0)[0]
+    if wrapped.size:
+        values, written = hill_values(wrapped, np.array([-1, nrow - 1]))
+        written[:, 0] &= ~(written[:, 1] & (l2[wrapped] == nrow))
+        m[-1] = np.maximum(m[-1], np.where(written[:, 0], values[:, 0],
+                                           1.).max())
 
     return m
+
+
+def mh_values(x, h, slope, l1_capital, l2_capital, escarp_factor, z):
+    """
+    Evaluate the topographic multiplier of hills at distances from their
+    ridges, following the branches of :func:`mh_calc`
+
+    :param x: :class:`numpy.ndarray` the distance to the ridge, positive
+              upwind
+    :param h: :class:`numpy.ndarray` or `float` the height of the hill
+    :param slope: :class:`numpy.ndarray` or `float` the upwind slope of the
+                  hill
+    :param l1_capital: :class:`numpy.ndarray` or `float` the length scale
+                       of the hill
+    :param l2_capital: :class:`numpy.ndarray` or `float` the extent of the
+                       hill
+    :param escarp_factor: :class:`numpy.ndarray` or `float` the escarpment
+                          factor
+    :param z: `float` the building height
+
+    :return: :class:`numpy.ndarray` the multipliers and
+             :class:`numpy.ndarray` the mask of the distances within the
+             influence of the hills
+    """
+
+    # within the region of l2_capital up to the ridge
+    front = (x >= 0) & (x < l2_capital)
+
+    # more or less a symmetrical hill
+    symmetrical = (~front & (slope > 0.45) & (x < 0) & (x > -h / 4) &
+                   (abs(escarp_factor - 1) < 0.2))
+
+    # within the region from the ridge2 up to the back l2_capital
+    back = (~front & ~symmetrical & (x < 0) &
+            (x > -escarp_factor * l2_capital))
+
+    # --------------------------------------------------------
+    # for larger slopes, you still use the formula to calculate M,
+    # then re-value to 1.71 when it is larger. If use 1.71 for any
+    # slope greater than 0.45, then all the points within the
+    # l2_capital zone will have 1.71 rather than a gradual increasing,
+    # peaks and decreasing pattern.
+    # --------------------------------------------------------
+    rise = h / (3.5 * (z + l1_capital))
+    values = np.where(front, np.minimum(
+        1 + rise * (1 - abs(x) / l2_capital), 1.71), 1.)
+    values = np.where(symmetrical, 1 + 0.71 * (
+        1 - abs(x) / (escarp_factor * l2_capital)), values)
+    values = np.where(back, np.minimum(1 + rise * (
+        1 - abs(x) / (escarp_factor * l2_capital)), 1.71), values)
+
+    return values, front | symmetrical | back
+
+
+def escarpment_factors(profiles, line_ind, nrow, ridge, lu, slope,
+                       data_spacing, backwards=False):
+    """
+    Calculate the escarpment factors of many hills at once, as
+    :func:`escarpment_factor`
+
+    :param profiles: :class:`numpy.ndarray` the elevation of each line in a
+                     row
+    :param line_ind: :class:`numpy.ndarray` the line of each hill
+    :param nrow: :class:`numpy.ndarray` the number of cells of each line
+    :param ridge: :class:`numpy.ndarray` the index of the ridge of each hill
+    :param lu: :class:`numpy.ndarray` the half length of each hill
+    :param slope: :class:`numpy.ndarray` the upwind slope of each hill
+    :param data_spacing: `float` distance between neighbour points of a line
+    :param backwards: `bool` True if the lines are walked backwards
+
+    :return: :class:`numpy.ndarray` the escarpment factors
+    """
+
+    max_escarp = 3
+    min_escarp = 0.5
+
+    beta_ind = np.minimum(nrow - 1, np.floor(ridge + (2 * lu / data_spacing)))
+    h_r2beta = (profiles[line_ind, get_cells(ridge, nrow, backwards)] -
+                profiles[line_ind, get_cells(beta_ind.astype(int), nrow,
+                                             backwards)])
+    d_r2beta = (beta_ind - ridge) * data_spacing
+
+    # the ridges on the end have a factor of 1
+    escarp_factor = np.ones(ridge.shape, dtype=float)
+    downwind = d_r2beta > 0
+    slope_r2ml2 = h_r2beta[downwind] / d_r2beta[downwind]
+    escarp_factor[downwind] = np.clip(
+        2.5 - 1.5 * slope_r2ml2 / slope[downwind], min_escarp, max_escarp)
+
+    return escarp_factor
+
+
+def get_cells(index, nrow, backwards):
+    """
+    Return the cells of a batch of lines at indices along the lines
+
+    :param index: :class:`numpy.ndarray` the indices along the lines
+    :param nrow: :class:`numpy.ndarray` the number of cells of the lines
+    :param backwards: `bool` True if the lines are walked backwards, the
+                      indices counting from their end
+
+    :return: :class:`numpy.ndarray` the cells of the rows of the batch
+    """
+
+    if backwards:
+        return nrow - 1 - index
+
+    return index
+
+
+def hilly_lines(profiles, lengths, data_spacing, pyramid=False):
+    """
+    Tell the lines of a batch which may hold a hill high and steep enough to
+    change the multiplier. A hill rises at most by the range of the
+    elevation between its valley and its ridge, so a line whose range is
+    below the height threshold has none. With the pyramid, the ranges of
+    blocks of 2, 4, 8, ... cells bound the rise of the hills by their
+    length, which also rules out the lines of long gentle slopes.
+
+    :param profiles: :class:`numpy.ndarray` the elevation of each line in a
+                     row, padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+    :param data_spacing: `float` distance between neighbour points of a line
+    :param pyramid: `bool` True to bound the hills by the ranges of blocks
+
+    :return: :class:`numpy.ndarray` False for the lines without such a hill
+    """
+
+    valid = np.arange(profiles.shape[1]) < lengths[:, None]
+    high = np.where(valid, profiles, -np.inf)
+    low = np.where(valid, profiles, np.inf)
+    hilly = high.max(axis=1) - low.min(axis=1) >= H_THRESHOLD
+    if not pyramid:
+        return hilly
+
+    rows = np.nonzero(hilly)[0]
+    high, low = high[rows], low[rows]
+    steep = np.zeros(rows.size, dtype=bool)
+
+    # a hill with its valley d cells from its ridge rises by at least
+    # max(H_THRESHOLD, SLOPE_THRESHOLD * d * data_spacing) over d + 1 cells,
+    # which lie within two adjacent blocks of size cells when d <= size.
+    # The bound is slightly lowered so the rounding of the slope of mh_calc
+    # cannot keep a pruned hill
+    size = 1
+    while size < profiles.shape[1] - 1:
+        if high.shape[1] % 2:
+            high = np.pad(high, ((0, 0), (0, 1)), constant_values=-np.inf)
+            low = np.pad(low, ((0, 0), (0, 1)), constant_values=np.inf)
+        high = np.maximum(high[:, 0::2], high[:, 1::2])
+        low = np.minimum(low[:, 0::2], low[:, 1::2])
+        size *= 2
+
+        if high.shape[1] > 1:
+            relief = (np.maximum(high[:, :-1], high[:, 1:]) -
+                      np.minimum(low[:, :-1], low[:, 1:]))
+        else:
+            relief = high - low
+        rise = max(H_THRESHOLD, SLOPE_THRESHOLD * (size // 2 + 1) *
+                   data_spacing * (1 - 1e-9))
+        steep |= relief.max(axis=1) >= rise
+
+    hilly[rows] = steep
+
+    return hilly
@@ -10,7 +10,8 @@ import numpy as np
 # calculate Mh using the simpler formula modified by C.Thomas 2009
 from topographic import mh
 # get the indices of the ridges in a data line
-from topographic.findpeaks import findpeaks, findvalleys
+from topographic.findpeaks import findpeaks, findvalleys, \
+    find_extrema_batch, extrema_masks, line_steps
 
 
 def multiplier_calc(line, data_spacing):
@@ -33,29 +34,197 @@ def multiplier_calc(line, data_spacing):
     # take the largest integer of each element of the data line
     fwd_line = np.floor(line)
 
+    # the multiplier of the line is the largest of those of its hills
+    for ridge, valley in zip(*get_hills(fwd_line)):
+        cells, m = mh.mh_span(fwd_line, ridge, valley, data_spacing)
+        m_array[cells, 0] = np.maximum(m_array[cells, 0], m)
+
+    return m_array
+
+
+def multiplier_sweep(line, data_spacing):
+    """
+    Computes the multipliers for a data line as :func:`multiplier_calc`
+    does, in one sweep along the line keeping the hills whose zone of
+    influence covers the current cells, see :func:`mh.mh_sweep`
+
+    :param line: :class:`numpy.ndarray` the elevation of a line
+    :param data_spacing: `float` the distance between the neighour points
+
+    :returns:  :class:`numpy.ndarray` the topographic values of the line
+    """
+
+    nrow = np.size(line)
+
+    # take the largest integer of each element of the data line
+    fwd_line = np.floor(line)
+
+    ridge_ind, valley_ind = get_hills(fwd_line)
+    if np.size(ridge_ind) == 0:
+        return np.ones((nrow, 1), dtype=float)
+
+    m_array = mh.mh_sweep(fwd_line, ridge_ind, valley_ind, data_spacing)
+
+    return m_array.reshape(nrow, 1)
+
+
+def multiplier_batch(lines, lengths, data_spacing):
+    """
+    Computes the multipliers for a batch of data lines at once
+
+    :param lines: :class:`numpy.ndarray` the elevation of each line in a row,
+                  padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+    :param data_spacing: `float` the distance between the neighour points
+
+    :returns:  :class:`numpy.ndarray` the topographic values of the lines,
+               1 on the padding
+    """
+
+    # take the largest integer of each element of the data lines
+    fwd_lines = np.floor(lines)
+
+    # the hills of all the lines, evaluated together
+    line_ind, ridge_ind, valley_ind = get_batch_hills(fwd_lines, lengths)
+
+    return mh.mh_batch(fwd_lines, lengths, line_ind, ridge_ind, valley_ind,
+                       data_spacing)
+
+
+def multiplier_batch_pair(lines, lengths, data_spacing):
+    """
+    Computes the multipliers for a batch of data lines at once, along the
+    lines and along the lines walked backwards, i.e. for two opposite
+    directions. The ridges and valleys of both are located from the same
+    differences of the lines.
+
+    :param lines: :class:`numpy.ndarray` the elevation of each line in a row,
+                  padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+    :param data_spacing: `float` the distance between the neighour points
+
+    :returns:  :class:`numpy.ndarray` the topographic values of the lines
+               and :class:`numpy.ndarray` those of the lines walked
+               backwards, both on the cells of the lines and 1 on the
+               padding
+    """
+
+    # take the largest integer of each element of the data lines
+    fwd_lines = np.floor(lines)
+
+    along, backwards = find_extrema_batch(fwd_lines, lengths)
+
+    m_along = mh.mh_batch(fwd_lines, lengths,
+                          *pair_hills(np.nonzero(along[0]),
+                                      np.nonzero(along[1]), lengths.size),
+                          data_spacing=data_spacing)
+
+    # the lines walked backwards are indexed from their end, the masks
+    # flipped give their ridges and valleys in that order
+    width = lines.shape[1]
+    back_ridges, back_valleys = [
+        (line, col - width + lengths[line])
+        for line, col in (np.nonzero(mask[:, ::-1]) for mask in backwards)]
+    m_back = mh.mh_batch(fwd_lines, lengths,
+                         *pair_hills(back_ridges, back_valleys, lengths.size),
+                         data_spacing=data_spacing, backwards=True)
+
+    return m_along, m_back
+
+
+def get_hills(fwd_line):
+    """
+    Pairs the ridges of a data line with their upwind valleys
+
+    :param fwd_line: :class:`numpy.ndarray` the elevation of a line, rounded
+                     down
+
+    :returns:  :class:`numpy.ndarray` the indices of the ridges and
+               :class:`numpy.ndarray` the indices of their valleys
+    """
+
     # Get the indices of the ridges & valleys
-    ridge_ind = findpeaks(fwd_line)        # relative ind
+    ridge_ind = np.atleast_1d(findpeaks(fwd_line))        # relative ind
     valley_ind = findvalleys(fwd_line)    # relative ind
 
     if np.size(ridge_ind) == 0:  # the DEM is completely flat
         log.debug("Flat line")
+        ridge_ind = valley_ind = np.empty(0, dtype=int)
 
     # the DEM is downward slope all the time
     elif np.size(ridge_ind) == 1 and ridge_ind[0] == 0:
         log.debug("Downward slope")
+        ridge_ind = valley_ind = np.empty(0, dtype=int)
 
-    else:                      # 2 general cases, calculate m, works as Mh.m
+    # 2 general cases, calculate m, works as Mh.m
+    elif ridge_ind[0] == 0:    # (1) down up down up ....
+        ridge_ind = ridge_ind[1:]
+        valley_ind = valley_ind[:np.size(ridge_ind)]
 
-        if ridge_ind[0] == 0:    # (1) down up down up ....
-            for i in range(1, np.size(ridge_ind)):
-                m = mh.mh_calc(fwd_line, ridge_ind[i], valley_ind[i - 1],
-                               data_spacing)
-                m_array = np.maximum(m_array, m)
+    else:                    # (2) up dowm up dowm ....
+        valley_ind = valley_ind[:np.size(ridge_ind)]
 
-        else:                    # (2) up dowm up dowm ....
-            for i in range(0, np.size(ridge_ind)):
-                m = mh.mh_calc(fwd_line, ridge_ind[i], valley_ind[i],
-                               data_spacing)
-                m_array = np.maximum(m_array, m)
+    return ridge_ind, valley_ind
 
-    return m_array
+
+def get_batch_hills(fwd_lines, lengths):
+    """
+    Pairs the ridges of many data lines with their upwind valleys at once,
+    as :func:`get_hills` does for each line
+
+    :param fwd_lines: :class:`numpy.ndarray` the elevation of each line in a
+                      row, rounded down and padded after the end of the line
+    :param lengths: :class:`numpy.ndarray` the number of cells of each line
+
+    :returns:  :class:`numpy.ndarray` the line, :class:`numpy.ndarray` the
+               index of the ridge and :class:`numpy.ndarray` the index of
+               the valley of each hill
+    """
+
+    steps = line_steps(fwd_lines, lengths)
+    ridges, valleys = extrema_masks(steps, steps['rise'], 1)
+
+    return pair_hills(np.nonzero(ridges), np.nonzero(valleys), lengths.size)
+
+
+def pair_hills(ridges, valleys, num_lines):
+    """
+    Pairs the ridges of many data lines with their upwind valleys
+
+    :param ridges: `tuple` of :class:`numpy.ndarray` the line and the index
+                   of each ridge, sorted by line and index
+    :param valleys: `tuple` of :class:`numpy.ndarray` the line and the index
+                    of each valley, sorted by line and index
+    :param num_lines: `int` the number of lines
+
+    :returns:  :class:`numpy.ndarray` the line, :class:`numpy.ndarray` the
+               index of the ridge and :class:`numpy.ndarray` the index of
+               the valley of each hill
+    """
+
+    ridge_line, ridge_ind = ridges
+    valley_line, valley_ind = valleys
+
+    num_ridges = np.bincount(ridge_line, minlength=num_lines)
+    first_ridge = np.cumsum(num_ridges) - num_ridges
+    num_valleys = np.bincount(valley_line, minlength=num_lines)
+    first_valley = np.cumsum(num_valleys) - num_valleys
+
+    # the lines going down from their start, (1) down up down up ....,
+    # pair each ridge with the valley before it and skip the first ridge,
+    # the others, (2) up dowm up dowm ...., with the valley of the same rank
+    down_first = np.zeros(num_lines, dtype=int)
+    ridged = num_ridges > 0
+    down_first[ridged] = ridge_ind[first_ridge[ridged]] == 0
+    num_hills = num_ridges - down_first
+
+    log.debug("{0} flat lines, {1} downward slopes".format(
+        np.sum(~ridged), np.sum(ridged & (num_hills == 0))))
+
+    ridge_rank = np.arange(ridge_ind.size) - first_ridge[ridge_line]
+    paired_ridges = ridge_rank >= down_first[ridge_line]
+    valley_rank = np.arange(valley_ind.size) - first_valley[valley_line]
+    paired_valleys = valley_rank < num_hills[valley_line]
+
+    return (ridge_line[paired_ridges], ridge_ind[paired_ridges],
+            valley_ind[paired_valleys])
@@ -17,140 +17,616 @@ tile for 8 directions and output as NetCDF format.
 
 """
 
-import os
 import math
 import logging as log
-from os.path import join as pjoin
+from functools import partial
+from itertools import chain
 import numpy as np
 from scipy import signal
-from osgeo import gdal
 
-from utilities.get_pixel_size_grid import get_pixel_size_grids
-from utilities.nctools import save_multiplier, get_lat_lon, clip_array
+from utilities.config import configparser as config
+from utilities.derivative_cache import get_cache_folder, load_arrays, \
+    save_arrays
+from utilities.nctools import save_multiplier, expand_window
+from utilities.parallel import map_threads, map_processes, shared_array, \
+    read_shared_array, shared_memory
 
 from topographic import make_path
+from topographic import mh
 from topographic import multiplier_calc
 
 __version__ = '1.0 - intergarate with terrian and shileding multiplier for \
                tiling and parallelisation'
 
+TOPOGRAPHIC_ENGINES = ('batch', 'sweep', 'line')
 
-def topomult(input_dem, tile_extents_nobuffer):
+# The pairs of opposite directions, which walk the same lines in opposite
+# orders
+DIRECTION_PAIRS = [('n', 's'), ('e', 'w'), ('ne', 'sw'), ('nw', 'se')]
+
+
+def topomult(tile):
     """
     Executes core topographic multiplier functionality
 
-    :param input_dem: `file` the input tile of the DEM
-    :param tile_extents_nobuffer: `tuple` the input tile extent without buffer
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
     """
 
-    # find output folder
-    mh_folder = pjoin(os.path.dirname(input_dem), 'topographic')
-    file_name = os.path.basename(input_dem)
+    cellsize = tile.get_gridwidth()
 
-    ds = gdal.Open(input_dem)
-    nc = ds.RasterXSize
-    nr = ds.RasterYSize
+    directions = ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw']
 
-    geotransform = ds.GetGeoTransform()
-    x_left = geotransform[0]
-    y_upper = -geotransform[3]
-    pixelwidth = geotransform[1]
-    pixelheight = -geotransform[5]
+    # the multiplier depends on the DEM only, a previous run over the same
+    # DEM may have cached it
+    cache_folder = get_cache_folder(tile.output_folder)
+    name = tile.name + '_mt'
+    key = tile.get_dem_key('topographic') if cache_folder else None
 
-    lon, lat = get_lat_lon(tile_extents_nobuffer, pixelwidth, pixelheight)
+    cached = load_arrays(cache_folder, name, key)
+    if cached is not None:
+        results = ((direction, cached[direction], (0, 0))
+                   for direction in directions)
+    else:
+        engine = get_topographic_engine()
+        log.info('Topographic engine is {0}'.format(engine))
+        pyramid = config.getboolean('Processing', 'relief_pyramid',
+                                    fallback=False)
+        batch_lines = get_topographic_batch_lines()
+        processes = get_topographic_processes()
+        groups = get_direction_groups(tile, engine)
+
+        # the directions, or pairs of opposite directions, are computed
+        # concurrently when processes or threads are configured and saved
+        # one at a time
+        if processes > 1:
+            results = topomult_processes(groups, tile, cellsize, engine,
+                                         pyramid, processes, batch_lines)
+        else:
+            results = chain.from_iterable(map_threads(
+                partial(topomult_directions, tile=tile, cellsize=cellsize,
+                        engine=engine, pyramid=pyramid,
+                        batch_lines=batch_lines), groups))
+
+    computed = {}
+    num_lines = num_pruned = 0
+    for direction, mhsmooth, (dir_lines, dir_pruned) in results:
+        log.info(direction)
+        num_lines += dir_lines
+        num_pruned += dir_pruned
 
-    band = ds.GetRasterBand(1)
-    elevation_array = band.ReadAsArray(0, 0, nc, nr)
+        # output format as netCDF4
+        tile_nc = tile.get_output_file('topographic', '_mt_', direction)
 
-    nodata_value = band.GetNoDataValue()
-    if nodata_value is not None:
-        elevation_array[np.where(elevation_array == nodata_value)] = np.nan
-    else:
-        elevation_array[np.where(elevation_array is None)] = np.nan
+        save_multiplier('Mt', mhsmooth, tile.lat, tile.lon, tile_nc)
+        if cache_folder and cached is None:
+            computed[direction] = mhsmooth
+        del mhsmooth
 
-    elevation_array_tran = np.transpose(elevation_array)
-    data = elevation_array_tran.flatten()
+        log.info('Finished direction {0}'.format(direction))
 
-    x_m_array, y_m_array = get_pixel_size_grids(ds)
-    cellsize = 0.5 * (np.mean(x_m_array) + np.mean(y_m_array))
+    if num_lines:
+        log.info('Pruned {0} of {1} topographic lines of tile {2} '
+                 'without a hill changing the multiplier'.format(
+                     num_pruned, num_lines, tile.name))
 
-    # Compute the starting positions along the boundaries depending on dir
-    # Together, the direction and the starting position determines a line.
-    # Note that the starting positions are defined
-    # in terms of the 1-d index of the array.
+    if computed:
+        save_arrays(cache_folder, name, key, computed)
 
-    directions = ['n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw']
 
-    for direction in directions:
-        log.info(direction)
+def get_direction_groups(tile, engine):
+    """
+    Groups the directions computed together: the batch engine computes two
+    opposite directions at once when they read the same extent
+
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+    :param engine: `str` 'batch', 'sweep' or 'line'
+
+    :return: `list` of `tuple` the groups of directions
+    """
 
-        if len(direction) == 2:
-            data_spacing = cellsize * math.sqrt(2)
+    groups = []
+    for pair in DIRECTION_PAIRS:
+        extents = [tile.get_halo_extent('topographic', direction)
+                   for direction in pair]
+        if engine == 'batch' and extents[0] == extents[1]:
+            groups.append(pair)
         else:
-            data_spacing = cellsize
-
-        mhdata = np.ones(data.shape)
-
-        strt_idx = []
-        if direction.find('n') >= 0:
-            strt_idx = np.append(strt_idx, list(range(0, nr * nc, nr)))
-        if direction.find('s') >= 0:
-            strt_idx = np.append(strt_idx, list(range(nr - 1, nr * nc, nr)))
-        if direction.find('e') >= 0:
-            strt_idx = np.append(strt_idx, list(range((nc - 1) * nr, nr * nc)))
-        if direction.find('w') >= 0:
-            strt_idx = np.append(strt_idx, list(range(0, nr)))
-
-        # For the diagonal directions the corner will have been counted twice
-        # so get rid of the duplicates then loop over the data lines
-        # (i.e. over the starting positions)
-        strt_idx = np.unique(strt_idx)
-
-        for ctr, idx in enumerate(strt_idx):
-            log.debug('Processing path %3i' % ctr + ' of %3i' % len(strt_idx) +
-                      ', index %5i.' % idx)
-
-            # Get a line of the data
-            # path is a 1-d vector which gives the indices of the data
-            path = make_path.make_path(nr, nc, idx, direction)
-            line = data[path]
-            line[np.isnan(line)] = 0.
-            m = multiplier_calc.multiplier_calc(line, data_spacing)
-
-            # write the line back to the data array
-            m = np.transpose(m)
-            mhdata[path] = m[0, ].flatten()
+            groups.extend((direction,) for direction in pair)
+
+    return groups
+
+
+def topomult_processes(groups, tile, cellsize, engine, pyramid, processes,
+                       batch_lines=None):
+    """
+    Computes the groups of directions of a tile on a pool of local
+    processes. The DEM of the tile and its nodata mask are copied once to
+    shared memory, from which each process reads the extent of its
+    directions.
+
+    :param groups: `list` of `tuple` the groups of directions, see
+                   :func:`get_direction_groups`
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+    :param cellsize: `float` the average grid size (m) of the tile
+    :param engine: `str` 'batch', 'sweep' or 'line'
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+    :param processes: `int` the number of processes
+    :param batch_lines: `int` the number of lines of a batch of the `batch`
+                        engine, all the lines in one batch if None
+
+    :return: generator of `tuple` the direction, the topographic multiplier
+             of the tile without buffer and the numbers of lines computed
+             and pruned of each direction, in the order of the groups
+    """
+
+    jobs = [(directions,) + get_direction_windows(tile, directions[0])
+            for directions in groups]
+
+    with shared_array(tile.dem) as dem, \
+            shared_array(tile.dem_mask) as dem_mask:
+        for results in map_processes(
+                partial(topomult_shared, dem=dem, dem_mask=dem_mask,
+                        cellsize=cellsize,
+                        apply_tasmania=in_tasmania(tile), engine=engine,
+                        pyramid=pyramid, batch_lines=batch_lines), jobs,
+                processes):
+            for result in results:
+                yield result
+
+
+def topomult_shared(job, dem, dem_mask, cellsize, apply_tasmania, engine,
+                    pyramid, batch_lines=None):
+    """
+    Computes the topographic multiplier of a group of directions from the
+    DEM of a tile in shared memory, in a process of the pool of
+    :func:`topomult_processes`
+
+    :param job: `tuple` the directions, the window of their extent in the
+                DEM and the window of the tile without buffer in the extent
+    :param dem: `tuple` the DEM shared by :func:`parallel.shared_array`
+    :param dem_mask: `tuple` the nodata mask of the DEM shared by
+                     :func:`parallel.shared_array`
+    :param cellsize: `float` the average grid size (m) of the tile
+    :param apply_tasmania: `bool` True if the Tasmania factor applies
+    :param engine: `str` 'batch', 'sweep' or 'line'
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+    :param batch_lines: `int` the number of lines of a batch of the `batch`
+                        engine, all the lines in one batch if None
+
+    :return: `list` of `tuple` as :func:`topomult_directions`
+    """
+
+    directions, dem_window, window = job
+
+    return topomult_elevation(directions, read_shared_array(dem, dem_window),
+                              read_shared_array(dem_mask, dem_window),
+                              window, cellsize, apply_tasmania, engine,
+                              pyramid, batch_lines)
+
+
+def topomult_direction(direction, tile, cellsize, engine='batch',
+                       pyramid=False, batch_lines=None):
+    """
+    Computes the topographic multiplier of one direction
+
+    :param direction: `str` the direction
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+    :param cellsize: `float` the average grid size (m) of the tile
+    :param engine: `str` 'batch', 'sweep' or 'line'
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+    :param batch_lines: `int` the number of lines of a batch of the `batch`
+                        engine, all the lines in one batch if None
+
+    :return: :class:`numpy.ndarray` the topographic multiplier of the tile
+             without buffer
+    """
+
+    return topomult_directions((direction,), tile, cellsize, engine,
+                               pyramid, batch_lines)[0][1]
+
+
+def topomult_directions(directions, tile, cellsize, engine='batch',
+                        pyramid=False, batch_lines=None):
+    """
+    Computes the topographic multiplier of one direction, or of two
+    opposite directions reading the same extent, which walk the same lines
+    in opposite orders
+
+    :param directions: `tuple` of `str` the direction or the opposite
+                       directions, see :func:`get_direction_groups`
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+    :param cellsize: `float` the average grid size (m) of the tile
+    :param engine: `str` 'batch', 'sweep' or 'line'
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+    :param batch_lines: `int` the number of lines of a batch of the `batch`
+                        engine, all the lines in one batch if None
+
+    :return: `list` of `tuple` the direction, the topographic multiplier
+             of the tile without buffer and the numbers of lines computed
+             and pruned of each direction
+    """
+
+    dem_window, window = get_direction_windows(tile, directions[0])
+
+    return topomult_elevation(directions, tile.dem[dem_window],
+                              tile.dem_mask[dem_window], window, cellsize,
+                              in_tasmania(tile), engine, pyramid,
+                              batch_lines)
+
+
+def get_direction_windows(tile, direction):
+    """
+    Locates the extent read by a direction: the lines of the direction are
+    read within the extent of the direction, which spans the tile along
+    them and the cells of the smoothing across them
+
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+    :param direction: `str` the direction
+
+    :return: `tuple` of `slice` the rows and columns of the extent in the
+             DEM of the tile and `tuple` of `slice` those of the tile
+             without buffer in the extent
+    """
+
+    extent = tile.get_halo_extent('topographic', direction)
+    if extent is None:
+        dem_window = tuple(slice(0, size) for size in tile.dem.shape)
+    else:
+        dem_window = tile.get_window(extent)
+    geotransform_dir = tile.get_dem(extent)[1]
+
+    return dem_window, tile.get_core_window(geotransform_dir)
+
+
+def in_tasmania(tile):
+    """
+    Check whether the Tasmania factor applies to a tile
+
+    :param tile: :class:`utilities.tile_context.TileContext` the inputs of
+                 the tile
+
+    :return: `bool` True if the tile is in Tasmania
+    """
+
+    x_left = tile.dem_geotransform[0]
+    y_upper = -tile.dem_geotransform[3]
+
+    return x_left > 143.0 and y_upper > 40.0
+
+
+def topomult_elevation(directions, elevation_dir, mask_dir, window,
+                       cellsize, apply_tasmania, engine='batch',
+                       pyramid=False, batch_lines=None):
+    """
+    Computes the topographic multiplier of one direction, or of two
+    opposite directions, from the elevation of their extent
+
+    :param directions: `tuple` of `str` the direction or the opposite
+                       directions, see :func:`get_direction_groups`
+    :param elevation_dir: :class:`numpy.ndarray` the elevation of the
+                          extent of the directions
+    :param mask_dir: :class:`numpy.ndarray` True for the nodata cells of
+                     the extent of the directions
+    :param window: `tuple` of `slice` the rows and columns of the tile
+                   without buffer in the extent
+    :param cellsize: `float` the average grid size (m) of the tile
+    :param apply_tasmania: `bool` True if the Tasmania factor applies
+    :param engine: `str` 'batch', 'sweep' or 'line'
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+    :param batch_lines: `int` the number of lines of a batch of the `batch`
+                        engine, all the lines in one batch if None
+
+    :return: `list` of `tuple` as :func:`topomult_directions`
+    """
+
+    direction = directions[0]
+    if len(direction) == 2:
+        data_spacing = cellsize * math.sqrt(2)
+    else:
+        data_spacing = cellsize
+
+    nr, nc = elevation_dir.shape
+    data = np.transpose(elevation_dir).flatten()
+    mask = np.transpose(mask_dir).flatten()
+
+    # only the cells of the tile without buffer and their neighbours read
+    # by the smoothing are evaluated. The lines crossing them are
+    # calculated over their full length, the other lines are skipped
+    smooth_window = expand_window(window, 1, elevation_dir.shape)
+    inner = tuple(slice(win.start - smw.start, win.stop - smw.start)
+                  for win, smw in zip(window, smooth_window))
+    elevation_window = elevation_dir[smooth_window]
+
+    if engine == 'line':
+        mhdatas = [multiplier_lines(data, mask, nr, nc, one_dir,
+                                    smooth_window, data_spacing,
+                                    pyramid=pyramid)
+                   for one_dir in directions]
+    elif engine == 'sweep':
+        mhdatas = [multiplier_lines(data, mask, nr, nc, one_dir,
+                                    smooth_window, data_spacing,
+                                    multiplier_calc.multiplier_sweep,
+                                    pyramid)
+                   for one_dir in directions]
+    else:
+        mhdatas, pruning = multiplier_batch(data, mask, nr, nc, directions,
+                                            smooth_window, data_spacing,
+                                            pyramid, batch_lines)
+        mhdatas = [(mhdata, pruning) for mhdata in mhdatas]
 
+    results = []
+    for one_dir, (mhdata, pruning) in zip(directions, mhdatas):
         # Reshape the result to matrix like
         mhdata = np.reshape(mhdata, (nc, nr))
-        mhdata = np.transpose(mhdata)
+        mhdata = np.transpose(mhdata)[smooth_window]
 
         # Remove the conservatism as described in the Reference
         mhdata = remove_conservatism(mhdata)
 
         # consider the Tasmania factor
-        if x_left > 143.0 and y_upper > 40.0:
-            mhdata = tasmania(mhdata, elevation_array)
+        if apply_tasmania:
+            mhdata = tasmania(mhdata, elevation_window)
 
         # smooth
         g = np.ones((3, 3)) / 9.
-        mhsmooth = signal.convolve(mhdata, g, mode='same')
-        mhsmooth[np.isnan(elevation_array)] = np.nan
+        mhsmooth = signal.convolve(mhdata, g, mode='same')[inner]
+        mhsmooth[mask_dir[window]] = np.nan
         del mhdata
 
-        # output format as netCDF4
-        tile_nc = pjoin(mh_folder, os.path.splitext(file_name)[0][:-4] +
-                        '_mt_' + direction + '.nc')
+        results.append((one_dir, mhsmooth, pruning))
 
-        mhsmooth_nobuffer = clip_array(mhsmooth, x_left, y_upper, pixelwidth,
-                                       pixelheight, tile_extents_nobuffer)
+    return results
 
-        save_multiplier('Mt', mhsmooth_nobuffer, lat, lon, tile_nc)
-        del mhsmooth
 
-        log.info('Finished direction {0}'.format(direction))
+def multiplier_lines(data, mask, nr, nc, direction, window, data_spacing,
+                     line_multiplier=multiplier_calc.multiplier_calc,
+                     pyramid=False):
+    """
+    Computes the topographic multiplier of the lines of a direction one
+    line at a time. The lines without a hill changing the multiplier are
+    skipped, see :func:`mh.hilly_lines`.
+
+    :param data: :class:`numpy.ndarray` the elevation of the tile by columns
+    :param mask: :class:`numpy.ndarray` True for the nodata cells of the
+                 tile by columns
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param direction: `str` the direction
+    :param window: `tuple` of `slice` the rows and columns evaluated
+    :param data_spacing: `float` the distance between the points of a line
+    :param line_multiplier: `function` the multiplier of one line,
+                            :func:`multiplier_calc.multiplier_calc` or
+                            :func:`multiplier_calc.multiplier_sweep`
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+
+    :return: :class:`numpy.ndarray` the multiplier of the tile by columns
+             and `tuple` the numbers of lines computed and pruned
+    """
+
+    mhdata = np.ones(data.shape)
+    num_lines = num_pruned = 0
+
+    # The lines of the direction and their starting positions along the
+    # boundaries, built once per tile size and direction
+    num_paths = len(make_path.get_path_set(nr, nc, direction)[0])
+
+    for ctr, (idx, path) in enumerate(make_path.make_paths(nr, nc,
+                                                           direction)):
+        # path is a 1-d vector which gives the indices of the data
+        if not path_in_window(path, nr, window):
+            continue
+
+        log.debug('Processing path %3i' % ctr + ' of %3i' % num_paths +
+                  ', index %5i.' % idx)
+
+        line = data[path]
+        line[mask[path]] = 0.
+        num_lines += 1
+        if not mh.hilly_lines(np.floor(line)[np.newaxis, :],
+                              np.array([line.size]), data_spacing,
+                              pyramid)[0]:
+            num_pruned += 1
+            continue
+
+        m = line_multiplier(line, data_spacing)
+
+        # write the line back to the data array
+        m = np.transpose(m)
+        mhdata[path] = m[0, ].flatten()
+
+    return mhdata, (num_lines, num_pruned)
+
+
+def multiplier_batch(data, mask, nr, nc, directions, window, data_spacing,
+                     pyramid=False, batch_lines=None):
+    """
+    Computes the topographic multiplier of the lines of a direction in
+    batches, the lines of a batch laid out as the rows of a 2-D array. Two
+    opposite directions are computed from the same batch of lines. The lines
+    without a hill changing the multiplier, in either direction, are
+    skipped, see :func:`mh.hilly_lines`.
+
+    :param data: :class:`numpy.ndarray` the elevation of the tile by columns
+    :param mask: :class:`numpy.ndarray` True for the nodata cells of the
+                 tile by columns
+    :param nr: `int` number of rows of the input DEM
+    :param nc: `int` number of columns of the input DEM
+    :param directions: `tuple` of `str` the direction or the opposite
+                       directions
+    :param window: `tuple` of `slice` the rows and columns evaluated
+    :param data_spacing: `float` the distance between the points of a line
+    :param pyramid: `bool` True to also prune the lines by the ranges of
+                    their blocks
+    :param batch_lines: `int` the number of lines of a batch, all the lines
+                        in one batch if None
+
+    :return: `list` of :class:`numpy.ndarray` the multiplier of the tile by
+             columns of each direction and `tuple` the numbers of lines
+             computed and pruned
+    """
+
+    num_paths = len(make_path.get_path_set(nr, nc, directions[0])[0])
+    if batch_lines is None:
+        batch_lines = num_paths
+
+    mhdatas = [np.ones(data.shape) for _ in directions]
+    num_lines = num_pruned = 0
+    for first in range(0, num_paths, batch_lines):
+        # the lines of the batch crossing the window, each a row of indices
+        # of the data
+        cells, valid = make_path.get_path_cells(
+            nr, nc, directions[0], slice(first, first + batch_lines))
+        crossing = paths_in_window(cells, valid, nr, window)
+        cells, valid = cells[crossing], valid[crossing]
+
+        lines = data[cells]
+        lines[mask[cells] | ~valid] = 0.
+        lengths = valid.sum(axis=1)
+
+        hilly = mh.hilly_lines(np.floor(lines), lengths, data_spacing,
+                               pyramid)
+        num_lines += hilly.size
+        num_pruned += hilly.size - int(np.count_nonzero(hilly))
+        if not np.any(hilly):
+            continue
+
+        cells, valid, lines, lengths = (values[hilly] for values in
+                                        (cells, valid, lines, lengths))
+        if len(directions) > 1:
+            ms = multiplier_calc.multiplier_batch_pair(lines, lengths,
+                                                       data_spacing)
+        else:
+            ms = [multiplier_calc.multiplier_batch(lines, lengths,
+                                                   data_spacing)]
+
+        # write the lines back to the data array
+        for mhdata, m in zip(mhdatas, ms):
+            mhdata[cells[valid]] = m[valid]
+        del cells, valid, lines, ms
+
+    log.debug('Pruned {1} of {0} paths without relief'.format(num_lines,
+                                                              num_pruned))
+
+    return mhdatas, (num_lines, num_pruned)
+
+
+def paths_in_window(cells, valid, nr, window):
+    """
+    Check which lines of the tile cross a window of it
+
+    :param cells: :class:`numpy.ndarray` the 1-d indices of the lines from
+                  :func:`make_path.get_path_cells`
+    :param valid: :class:`numpy.ndarray` the mask of the cells on the lines
+    :param nr: `int` number of rows of the input DEM
+    :param window: `tuple` of `slice` the rows and columns of the window
+
+    :return: :class:`numpy.ndarray` True for the lines with a cell within
+             the window
+    """
+
+    row = cells % nr
+    col = cells // nr
+
+    return np.any(valid & (row >= window[0].start) &
+                  (row < window[0].stop) & (col >= window[1].start) &
+                  (col < window[1].stop), axis=1)
+
+
+def path_in_window(path, nr, window):
+    """
+    Check whether a line of the tile crosses a window of it
+
+    :param path: `list` the 1-d indices of the line from
+                 :func:`make_path.make_path`
+    :param nr: `int` number of rows of the input DEM
+    :param window: `tuple` of `slice` the rows and columns of the window
+
+    :return: `bool` True if any cell of the line is within the window
+    """
+
+    path = np.asarray(path)
+    row = path % nr
+    col = path // nr
+
+    return bool(np.any((row >= window[0].start) & (row < window[0].stop) &
+                       (col >= window[1].start) & (col < window[1].stop)))
+
+
+def get_topographic_engine():
+    """
+    Read the topographic engine from the config file. The `batch` engine
+    (default) computes batches of the lines of a direction as the rows of a
+    2-D array, `sweep` computes one line at a time in one sweep along it
+    keeping the hills active over the current cells, with little memory,
+    `line` is the original
+    implementation computing one hill at a time, kept as a reference.
+
+    :returns: `str` the name of the engine
+    """
+    engine = config.get('Processing', 'topographic_engine',
+                        fallback='batch').strip().lower()
+    if engine not in TOPOGRAPHIC_ENGINES:
+        log.critical(f'Unknown topographic engine: {engine}')
+        raise ValueError(
+            f'topographic_engine must be one of {TOPOGRAPHIC_ENGINES}')
+
+    return engine
+
+
+def get_topographic_processes():
+    """
+    Read the number of local processes computing the directions of a tile
+    from the config file. With more than one, the directions are computed
+    on a pool of processes sharing the DEM of the tile, instead of the
+    threads of :func:`parallel.map_threads`. Defaults to 1, computing them
+    in the calling process.
+
+    :returns: `int` the number of processes
+    """
+
+    processes = config.getint('Processing', 'topographic_processes',
+                              fallback=1)
+    if processes < 1:
+        log.warning('topographic_processes must be at least 1, using 1')
+        processes = 1
+    elif processes > 1 and shared_memory is None:
+        log.warning('Shared memory is not available, computing the '
+                    'topographic directions in the calling process')
+        processes = 1
+
+    return processes
+
+
+def get_topographic_batch_lines():
+    """
+    Read the number of lines of a batch of the `batch` topographic engine
+    from the config file. The memory of a batch grows with its number of
+    lines times the length of the lines, in every thread or process
+    computing directions. Defaults to 500, 0 computes all the lines of a
+    direction in one batch.
+
+    :returns: `int` the number of lines of a batch, None for all the lines
+    """
+
+    batch_lines = config.getint('Processing', 'topographic_batch_lines',
+                                fallback=500)
+    if batch_lines < 0:
+        log.warning('topographic_batch_lines must be at least 0, using 500')
+        batch_lines = 500
 
-    ds = None
+    return batch_lines or None
 
 
 def tasmania(mh_in, dem):
@@ -0,0 +1,211 @@
+"""
+:mod:`classification` -- lookup tables of the terrain classification
+===============================================================================
+
+Reclassify the landcover categories into initial terrain and shielding
+multipliers with dense lookup tables indexed by category code, so each tile
+is reclassified in a single :func:`numpy.take` pass whatever the number of
+categories. The terrain table is parsed once per process.
+
+"""
+
+import logging as log
+import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# largest span of category codes stored as a dense lookup table, wider
+# spans fall back to a binary search of the sorted categories
+MAX_LUT_SIZE = 2 ** 20
+
+
+def roughness2mz(roughness):
+    """
+    Convert the roughness length into the initial terrain multiplier
+
+    :param roughness: `float` or :class:`numpy.ndarray` roughness length (m)
+
+    :returns: `float` or :class:`numpy.ndarray` initial terrain multiplier
+    """
+
+    return -0.2827 * np.log(0.4554 * np.log(roughness) + 3.734) + 1.0762
+
+
+class LookupTable(object):
+
+    """
+    Map landcover category codes to values. Codes missing from the table
+    are given the fill value.
+
+    """
+
+    def __init__(self, categories, values, fill):
+        """
+        Build the lookup table. Where a category is repeated the last value
+        is used, as the row-by-row reclassification did.
+
+        :param categories: sequence of the category codes
+        :param values: sequence of the value of each category
+        :param fill: `float` the value of codes missing from the table
+
+        """
+
+        categories = np.asarray(categories, dtype=float)
+        values = np.asarray(values, dtype=np.float32)
+
+        # keep the last value of repeated categories
+        rev_categories, rev_index = np.unique(categories[::-1],
+                                              return_index=True)
+        self.categories = rev_categories
+        self.values = values[::-1][rev_index]
+        self.fill = np.float32(fill)
+
+        self.lut = None
+        self.offset = 0
+        self._dtype_luts = {}
+        if self.categories.size > 0 and \
+                np.all(np.mod(self.categories, 1) == 0):
+            low = int(self.categories[0])
+            span = int(self.categories[-1]) - low + 1
+            if span <= MAX_LUT_SIZE:
+                self.offset = low
+                self.lut = np.full(span, self.fill, dtype=np.float32)
+                self.lut[self.categories.astype(np.int64) - low] = \
+                    self.values
+
+    def _dtype_lut(self, dtype):
+        """
+        Return the lookup table covering every value of a small integer
+        type, ordered by the unsigned bit pattern of the values so that the
+        data can index it directly
+
+        :param dtype: :class:`numpy.dtype` an integer type of 1 or 2 bytes
+
+        :returns: :class:`numpy.ndarray` the lookup table
+        """
+
+        if dtype not in self._dtype_luts:
+            unsigned = np.dtype('u{0}'.format(dtype.itemsize))
+            codes = np.arange(2 ** (8 * dtype.itemsize), dtype=unsigned)
+            self._dtype_luts[dtype] = self._lookup(codes.view(dtype))
+
+        return self._dtype_luts[dtype]
+
+    def _lookup(self, data):
+        """
+        Reclassify data of any type against the table
+
+        :param data: :class:`numpy.ndarray` the category codes
+
+        :returns: :class:`numpy.ndarray` the values of the codes
+        """
+
+        if self.lut is None:
+            if self.categories.size == 0:
+                return np.full(data.shape, self.fill, dtype=np.float32)
+            index = np.searchsorted(self.categories, data)
+            np.minimum(index, self.categories.size - 1, out=index)
+            found = self.categories[index] == data
+            return np.where(found, self.values[index], self.fill)
+
+        index = np.subtract(data, self.offset, dtype=np.float64)
+        found = (index >= 0) & (index < self.lut.size)
+        if data.dtype.kind == 'f':
+            found &= np.mod(index, 1) == 0
+        index = np.where(found, index, 0).astype(np.intp)
+        outdata = np.take(self.lut, index)
+        outdata[~found] = self.fill
+
+        return outdata
+
+    def reclassify(self, data):
+        """
+        Reclassify the landcover categories into the table values
+
+        :param data: :class:`numpy.ndarray` the category codes
+
+        :returns: :class:`numpy.ndarray` float32 values of the categories
+        """
+
+        data = np.asarray(data)
+        if data.dtype.kind in 'iu' and data.dtype.itemsize <= 2:
+            unsigned = np.dtype('u{0}'.format(data.dtype.itemsize))
+            return np.take(self._dtype_lut(data.dtype), data.view(unsigned))
+
+        return self._lookup(data).astype(np.float32, copy=False)
+
+
+def mz_lookup(terrain_table):
+    """
+    Build the lookup table of the initial terrain multiplier
+
+    :param terrain_table: :class:`pandas.DataFrame` the terrain table
+
+    :returns: :class:`LookupTable` of the initial terrain multiplier, 0 for
+              unknown categories
+    """
+
+    return LookupTable(terrain_table['CATEGORY'],
+                       roughness2mz(terrain_table['ROUGHNESS_LENGTH_m']),
+                       0.)
+
+
+def ms_lookup(terrain_table):
+    """
+    Build the lookup table of the initial shielding factor
+
+    :param terrain_table: :class:`pandas.DataFrame` the terrain table
+
+    :returns: :class:`LookupTable` of the initial shielding factor, 1 for
+              unknown categories
+    """
+
+    return LookupTable(terrain_table['CATEGORY'],
+                       terrain_table['SHIELDING'] / 100., 1.)
+
+
+@lru_cache(maxsize=None)
+def load_terrain_table(terrain_table):
+    """
+    Read the terrain table once per process
+
+    :param terrain_table: `str` the csv file of the terrain table
+
+    :returns: :class:`pandas.DataFrame` of the terrain classification data,
+              shared between callers and not to be modified
+    """
+
+    log.info('Reading in the terrain table {0}'.format(terrain_table))
+    try:
+        return pd.read_csv(terrain_table, comment='#', index_col=False)
+    except IOError:
+        log.exception(f"Terrain table file does not exist: {terrain_table}")
+        sys.exit()
+
+
+@lru_cache(maxsize=None)
+def get_mz_lookup(terrain_table):
+    """
+    Return the cached lookup table of the initial terrain multiplier
+
+    :param terrain_table: `str` the csv file of the terrain table
+
+    :returns: :class:`LookupTable` of the initial terrain multiplier
+    """
+
+    return mz_lookup(load_terrain_table(terrain_table))
+
+
+@lru_cache(maxsize=None)
+def get_ms_lookup(terrain_table):
+    """
+    Return the cached lookup table of the initial shielding factor
+
+    :param terrain_table: `str` the csv file of the terrain table
+
+    :returns: :class:`LookupTable` of the initial shielding factor
+    """
+
+    return ms_lookup(load_terrain_table(terrain_table))
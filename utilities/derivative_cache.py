@@ -0,0 +1,135 @@
+"""
+:mod:`derivative_cache` -- cache of the products derived from the DEM
+===============================================================================
+
+The slope, aspect classes and topographic multipliers of a tile depend only
+on its DEM. When the `derivative_cache` option of the `Processing` section
+is set, they are stored as compressed arrays in the `cache` folder of the
+output, keyed by a hash of the DEM and its geometry, and read back by later
+runs over the same DEM instead of being computed again, e.g. when only the
+landcover or the terrain table changed.
+
+"""
+
+import os
+import hashlib
+import logging as log
+import zipfile
+from os.path import join as pjoin
+
+import numpy as np
+
+from utilities.config import configparser as config
+
+# Changed whenever the derivation of the cached products changes, so the
+# products of previous versions are not read
+CACHE_VERSION = 1
+
+CACHE_FOLDER = 'cache'
+
+
+def get_cache_folder(output_folder):
+    """
+    Return the cache folder of an output folder
+
+    :param output_folder: `str` the output folder of the multipliers
+
+    :return: `str` the cache folder, None if the cache is disabled
+    """
+
+    if not config.getboolean('Processing', 'derivative_cache',
+                             fallback=False):
+        return None
+
+    return pjoin(output_folder, CACHE_FOLDER)
+
+
+def get_key(*items):
+    """
+    Hash the values a product is derived from
+
+    :param items: the arrays and other values, e.g. tuples of numbers
+
+    :return: `str` the hexadecimal digest of the items
+    """
+
+    digest = hashlib.sha1(str(CACHE_VERSION).encode())
+    for item in items:
+        if isinstance(item, np.ndarray):
+            digest.update(str((item.dtype.str, item.shape)).encode())
+            digest.update(np.ascontiguousarray(item).tobytes())
+        else:
+            digest.update(repr(item).encode())
+
+    return digest.hexdigest()
+
+
+def get_cache_file(cache_folder, name, key):
+    """
+    Return the file of a cached product
+
+    :param cache_folder: `str` the cache folder
+    :param name: `str` the name of the product, e.g. the tile and multiplier
+    :param key: `str` the key of the product from :func:`get_key`
+
+    :return: `str` the file name
+    """
+
+    return pjoin(cache_folder, '{0}_{1}.npz'.format(name, key))
+
+
+def load_arrays(cache_folder, name, key):
+    """
+    Read the arrays of a cached product
+
+    :param cache_folder: `str` the cache folder, None if disabled
+    :param name: `str` the name of the product
+    :param key: `str` the key of the product from :func:`get_key`
+
+    :return: `dict` of :class:`numpy.ndarray` the arrays of the product,
+             None if it is not cached
+    """
+
+    if cache_folder is None:
+        return None
+
+    cache_file = get_cache_file(cache_folder, name, key)
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        with np.load(cache_file) as cached:
+            arrays = dict((item, cached[item]) for item in cached.files)
+    except (OSError, ValueError, zipfile.BadZipFile):
+        log.warning('Ignoring the unreadable cache file {0}'.format(
+            cache_file))
+        return None
+
+    log.info('Read {0} from the cache'.format(name))
+
+    return arrays
+
+
+def save_arrays(cache_folder, name, key, arrays):
+    """
+    Store the arrays of a product in the cache. The file is written under a
+    temporary name and then renamed, so other processes never read it
+    partially written.
+
+    :param cache_folder: `str` the cache folder, None if disabled
+    :param name: `str` the name of the product
+    :param key: `str` the key of the product from :func:`get_key`
+    :param arrays: `dict` of :class:`numpy.ndarray` the arrays of the product
+
+    """
+
+    if cache_folder is None:
+        return
+
+    os.makedirs(cache_folder, exist_ok=True)
+    cache_file = get_cache_file(cache_folder, name, key)
+    temp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+
+    with open(temp_file, 'wb') as temp:
+        np.savez_compressed(temp, **arrays)
+    os.replace(temp_file, cache_file)
@@ -10,6 +10,7 @@ import numpy as np
 import time
 import getpass
 import subprocess
+from functools import lru_cache
 
 from utilities.config import configparser as config
 from utilities.files import fl_program_version
@@ -19,22 +20,20 @@ LOGGER.addHandler(logging.NullHandler())
 ISO_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 
-def clip_array(data, x_left, y_upper, pixelwidth, pixelheight, extent):
+def get_clip_window(x_left, y_upper, pixelwidth, pixelheight, extent):
 
     """
-    Return the clipped area of the input array according to an sub-extent
+    Return the rows and columns of the input array covered by a sub-extent
 
-    :param data: :class:`numpy.ndarray` the input array
     :param x_left: `float` the left-most longitude vlaue
     :param y_upper: `float` the upper-most latitude values
     :param pixelwidth: `float` the pixel width
     :param pixelheight: `float` the pixel height
     :param extent: `tuple` the clipping extent
 
-    :return: :class:`numpy.ndarray` the clipped array
+    :return: `tuple` of `slice` the rows and columns of the clipped area
 
     """
-    LOGGER.debug("Clipping the array using extent: {0}".format(repr(extent)))
 
     lon_start = int(np.around((extent[0] - x_left)/pixelwidth))
     lat_start = int(np.around((-y_upper - extent[1])/pixelheight))
@@ -45,11 +44,85 @@ def clip_array(data, x_left, y_upper, pixelwidth, pixelheight, extent):
     lon_end = lon_start + cols
     lat_end = lat_start + rows
 
-    data_clip = data[lat_start:lat_end, lon_start:lon_end]
+    return slice(lat_start, lat_end), slice(lon_start, lon_end)
+
+
+def clip_array(data, x_left, y_upper, pixelwidth, pixelheight, extent):
+
+    """
+    Return the clipped area of the input array according to an sub-extent
+
+    :param data: :class:`numpy.ndarray` the input array
+    :param x_left: `float` the left-most longitude vlaue
+    :param y_upper: `float` the upper-most latitude values
+    :param pixelwidth: `float` the pixel width
+    :param pixelheight: `float` the pixel height
+    :param extent: `tuple` the clipping extent
+
+    :return: :class:`numpy.ndarray` the clipped array
+
+    """
+    LOGGER.debug("Clipping the array using extent: {0}".format(repr(extent)))
+
+    window = get_clip_window(x_left, y_upper, pixelwidth, pixelheight,
+                             extent)
+
+    data_clip = data[window]
 
     return data_clip
 
 
+def expand_window(window, halo, shape):
+
+    """
+    Grow a window by a number of cells on every side, limited to the array
+
+    :param window: `tuple` of `slice` the rows and columns of the window
+    :param halo: `int` the number of cells added on every side
+    :param shape: `tuple` the shape of the array
+
+    :return: `tuple` of `slice` the rows and columns of the grown window
+
+    """
+
+    return tuple(slice(max(win.start - halo, 0), min(win.stop + halo, size))
+                 for win, size in zip(window, shape))
+
+
+def read_window(band, window):
+
+    """
+    Read the cells of a window of a raster band
+
+    :param band: :class:`gdal.Band` the raster band
+    :param window: `tuple` of `slice` the rows and columns of the window
+
+    :return: :class:`numpy.ndarray` the values of the window
+
+    """
+
+    return band.ReadAsArray(window[1].start, window[0].start,
+                            window[1].stop - window[1].start,
+                            window[0].stop - window[0].start)
+
+
+def get_union_extent(extents):
+
+    """
+    Return the smallest extent covering a number of extents
+
+    :param extents: `list` of `tuple` the extents
+
+    :return: `tuple` the minimum x, maximum y, maximum x and minimum y
+
+    """
+
+    extents = np.array(list(extents))
+
+    return (extents[:, 0].min(), extents[:, 1].max(),
+            extents[:, 2].max(), extents[:, 3].min())
+
+
 def get_lat_lon(extent, pixelwidth, pixelheight):
     """
     Return the longitude and latitude values that lie within
@@ -293,6 +366,20 @@ def nc_save_grid(filename, dimensions, variables, nodata=-9999,
             return
 
 
+@lru_cache(maxsize=None)
+def get_git_info():
+    """
+    Describe the git version of the code, once per process. The git command
+    is executed from the code, not from the data directory, without
+    changing the working directory of the process.
+
+    :return: `bytes` the output of `git describe`
+    """
+
+    return subprocess.check_output(
+        ["git", "describe"], cwd=os.path.dirname(os.path.realpath(__file__)))
+
+
 def save_multiplier(multiplier_name, multiplier_values, lat, lon, nc_name):
     """
     Save multiplier data to a netCDF file.
@@ -316,12 +403,7 @@ def save_multiplier(multiplier_name, multiplier_values, lat, lon, nc_name):
     terrain_map = config.get('inputValues', 'terrain_data')
     dem = config.get('inputValues', 'dem_data')
 
-    # Collect git info - need to make sure git command is executed from
-    # code - not from data directory
-    cwd = os.getcwd()  # save working directory
-    os.chdir(os.path.dirname(os.path.realpath(__file__)))
-    git_info = subprocess.check_output(["git", "describe"])
-    os.chdir(cwd)  # restore working directory from saved value
+    git_info = get_git_info()
 
     # Set global attributes, including metadata capture:
     global_atts = {'Abstract': ('This dataset is the local ' +
@@ -17,8 +17,21 @@
 
 """
 
+import logging as log
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import wraps
 
+import numpy as np
+
+from utilities.config import configparser as config
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, the arrays cannot be shared between processes
+    shared_memory = None
+
 
 class DummyStatus(object):
     """
@@ -135,3 +148,124 @@ def disable_on_workers(f):
         else:
             return f(*args, **kwargs)
     return wrap
+
+
+def get_thread_budget():
+    """
+    Read the number of threads each process uses to compute the directions
+    of a tile concurrently. Defaults to 1, computing them one after another.
+
+    :returns: `int` the number of threads
+    """
+
+    threads = config.getint('Processing', 'threads', fallback=1)
+    if threads < 1:
+        log.warning('threads must be at least 1, using 1')
+        threads = 1
+
+    return threads
+
+
+def map_threads(func, items, threads=None):
+    """
+    Apply a function to each item, on a pool of threads when more than one
+    thread is available. The results are yielded in the order of the items
+    in the calling thread, so they can be written out one at a time by code
+    that is not thread safe, e.g. netCDF output.
+
+    The function is run concurrently with itself and must not modify
+    shared state. Its NumPy, SciPy and numexpr calls release the GIL.
+
+    :param func: function of one item
+    :param items: `list` the items
+    :param threads: `int` the number of threads, read from the
+                    configuration if None
+
+    :returns: generator of the results of `func`
+    """
+
+    if threads is None:
+        threads = get_thread_budget()
+
+    if threads <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(items))) as pool:
+        for result in pool.map(func, items):
+            yield result
+
+
+def map_processes(func, items, processes):
+    """
+    Apply a function to each item, on a pool of local processes when more
+    than one process is requested. The results are yielded in the order of
+    the items in the calling process, as :func:`map_threads` does.
+
+    The function, its arguments and its results are pickled to and from
+    the processes: it must be defined at the top level of a module, and
+    large inputs are better passed through :func:`shared_array`.
+
+    :param func: function of one item
+    :param items: `list` the items
+    :param processes: `int` the number of processes
+
+    :returns: generator of the results of `func`
+    """
+
+    if processes <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(processes,
+                                             len(items))) as pool:
+        for result in pool.map(func, items):
+            yield result
+
+
+@contextmanager
+def shared_array(array):
+    """
+    Copy an array to a block of shared memory, which the processes of a
+    pool read with :func:`read_shared_array` instead of receiving a pickled
+    copy. The block is released on exit.
+
+    :param array: :class:`numpy.ndarray` the array
+
+    :returns: `tuple` the name, shape and type of the shared array
+    """
+
+    block = shared_memory.SharedMemory(create=True,
+                                       size=max(array.nbytes, 1))
+    try:
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        yield block.name, array.shape, array.dtype.str
+    finally:
+        block.close()
+        block.unlink()
+
+
+def read_shared_array(shared, window=None):
+    """
+    Read a window of an array shared by :func:`shared_array`
+
+    :param shared: `tuple` the name, shape and type of the shared array
+    :param window: `tuple` of `slice` the window, the whole array if None
+
+    :returns: :class:`numpy.ndarray` a copy of the values of the window
+    """
+
+    name, shape, dtype = shared
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        array = np.ndarray(shape, dtype, buffer=block.buf)
+        if window is not None:
+            array = array[window]
+        values = array.copy()
+        del array
+    finally:
+        block.close()
+
+    return values
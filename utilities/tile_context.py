@@ -0,0 +1,295 @@
+"""
+:mod:`tile_context` -- decoded inputs of a tile shared between multipliers
+===============================================================================
+
+The DEM and landcover of a tile are read and decoded once into a
+:class:`TileContext`, which is handed to the terrain, shielding and
+topographic multipliers together with the tile geometry: geotransforms,
+the latitude and longitude of the output, the pixel size grids and the
+nodata masks.
+
+"""
+
+import logging as log
+from os.path import join as pjoin
+
+import numpy as np
+
+from utilities.derivative_cache import get_key
+from utilities.get_pixel_size_grid import get_pixel_size_grids
+from utilities.nctools import get_lat_lon, get_clip_window, get_union_extent
+
+
+def read_band(dataset):
+    """
+    Read the first band of a dataset
+
+    :param dataset: :class:`gdal.Dataset` the input dataset
+
+    :return: :class:`numpy.ndarray` the values and the nodata value
+    """
+
+    band = dataset.GetRasterBand(1)
+
+    return band.ReadAsArray(), band.GetNoDataValue()
+
+
+class TileContext(object):
+
+    """
+    The inputs of a tile, read once and shared by all the multipliers
+
+    """
+
+    def __init__(self, tile_info, output_folder, dem_ds, landcover_ds=None):
+        """
+        Read and decode the DEM and landcover of a tile
+
+        :param tile_info: `tuple` the tile info of the tile
+        :param output_folder: `str` the output folder of the multipliers
+        :param dem_ds: :class:`gdal.Dataset` the DEM tile with buffer
+        :param landcover_ds: :class:`gdal.Dataset` the landcover tile on the
+                             grid of the DEM tile
+
+        """
+
+        self.name = tile_info[0]
+        self.extents_buffer = tile_info[1]
+        self.extents_nobuffer = tile_info[2]
+        self.extents_halo = tile_info[3] if len(tile_info) > 3 else None
+        self.output_folder = output_folder
+
+        log.debug('Reading the inputs of tile {0}'.format(self.name))
+
+        self.dem_geotransform = dem_ds.GetGeoTransform()
+        self.projection = dem_ds.GetProjection()
+        self.pixelwidth = self.dem_geotransform[1]
+        self.pixelheight = -self.dem_geotransform[5]
+
+        # the DEM keeps its type, with nodata as NaN
+        self.dem, self.dem_nodata = read_band(dem_ds)
+        if self.dem.dtype.kind != 'f':
+            self.dem = self.dem.astype(float)
+        if self.dem_nodata is not None:
+            self.dem[self.dem == self.dem_nodata] = np.nan
+        self.dem_mask = np.isnan(self.dem)
+        self._dem_digest = None
+
+        self.lon, self.lat = get_lat_lon(self.extents_nobuffer,
+                                         self.pixelwidth, self.pixelheight)
+        self.x_m_array, self.y_m_array = get_pixel_size_grids(dem_ds)
+
+        self.landcover = None
+        self.landcover_nodata = None
+        self.landcover_geotransform = None
+        self.landcover_mask = None
+        if landcover_ds is not None:
+            self.landcover, self.landcover_nodata = read_band(landcover_ds)
+            self.landcover_geotransform = landcover_ds.GetGeoTransform()
+            if self.landcover_nodata is not None:
+                self.landcover_mask = self.landcover == self.landcover_nodata
+            else:
+                self.landcover_mask = np.zeros(self.landcover.shape, bool)
+
+    def get_window(self, extent, geotransform=None):
+        """
+        Return the rows and columns of an extent on a grid of the tile
+
+        :param extent: `tuple` the extent
+        :param geotransform: `tuple` the geotransform of the grid, the DEM
+                             if None
+
+        :return: `tuple` of `slice` the rows and columns of the extent
+        """
+
+        if geotransform is None:
+            geotransform = self.dem_geotransform
+
+        return get_clip_window(geotransform[0], -geotransform[3],
+                               geotransform[1], -geotransform[5], extent)
+
+    def get_core_window(self, geotransform=None):
+        """
+        Return the rows and columns of the tile without buffer on a grid of
+        the tile
+
+        :param geotransform: `tuple` the geotransform of the grid, the DEM
+                             if None
+
+        :return: `tuple` of `slice` the rows and columns of the core
+        """
+
+        return self.get_window(self.extents_nobuffer, geotransform)
+
+    def get_halo_extent(self, multiplier, one_dir=None):
+        """
+        Return the extent read by a multiplier
+
+        :param multiplier: `str` 'terrain', 'shielding' or 'topographic'
+        :param one_dir: `str` the direction, all directions if None
+
+        :return: `tuple` the extent, or None for the whole tile
+        """
+
+        if self.extents_halo is None:
+            return None
+        if one_dir is not None:
+            return self.extents_halo[multiplier][one_dir]
+
+        return get_union_extent(self.extents_halo[multiplier].values())
+
+    def get_dem(self, extent=None):
+        """
+        Return the DEM within an extent
+
+        :param extent: `tuple` the extent, the whole tile if None
+
+        :return: :class:`numpy.ndarray` the DEM values and `tuple` their
+                 geotransform
+        """
+
+        return self.get_layer(self.dem, self.dem_geotransform, extent)
+
+    def get_landcover(self, extent=None):
+        """
+        Return the landcover within an extent
+
+        :param extent: `tuple` the extent, the whole landcover tile if None
+
+        :return: :class:`numpy.ndarray` the landcover values and `tuple`
+                 their geotransform
+        """
+
+        return self.get_layer(self.landcover, self.landcover_geotransform,
+                              extent)
+
+    def get_landcover_mask(self, extent=None):
+        """
+        Return the nodata mask of the landcover within an extent
+
+        :param extent: `tuple` the extent, the whole landcover tile if None
+
+        :return: :class:`numpy.ndarray` True for the landcover nodata cells
+        """
+
+        return self.get_layer(self.landcover_mask,
+                              self.landcover_geotransform, extent)[0]
+
+    def get_halo_layer(self, data, geotransform, multiplier, directions):
+        """
+        Return the values of a layer of the tile within the extent read by a
+        multiplier for some directions, e.g. the upwind halo of one direction
+
+        :param data: :class:`numpy.ndarray` the values of the layer, covering
+                     the extent
+        :param geotransform: `tuple` the geotransform of the layer
+        :param multiplier: `str` 'terrain', 'shielding' or 'topographic'
+        :param directions: `list` of `str` the directions
+
+        :return: :class:`numpy.ndarray` the values, `tuple` their
+                 geotransform and `tuple` of `slice` the rows and columns of
+                 the tile without buffer within them
+        """
+
+        extent = None
+        if self.extents_halo is not None:
+            extent = get_union_extent([self.extents_halo[multiplier][one_dir]
+                                       for one_dir in directions])
+        data, geotransform = self.get_layer(data, geotransform, extent)
+
+        return data, geotransform, self.get_core_window(geotransform)
+
+    def get_layer(self, data, geotransform, extent):
+        """
+        Return the values of a layer of the tile within an extent
+
+        :param data: :class:`numpy.ndarray` the values of the layer
+        :param geotransform: `tuple` the geotransform of the layer
+        :param extent: `tuple` the extent, the whole layer if None
+
+        :return: :class:`numpy.ndarray` the values and `tuple` their
+                 geotransform
+        """
+
+        if extent is None:
+            return data, geotransform
+
+        window = self.get_window(extent, geotransform)
+        geotransform = (geotransform[0] + window[1].start * geotransform[1],
+                        geotransform[1], geotransform[2],
+                        geotransform[3] + window[0].start * geotransform[5],
+                        geotransform[4], geotransform[5])
+
+        return data[window], geotransform
+
+    def get_pixel_size_grids(self, geotransform, shape):
+        """
+        Return the pixel size grids of a grid of the tile
+
+        :param geotransform: `tuple` the geotransform of the grid
+        :param shape: `tuple` the shape of the grid
+
+        :return: tuple of :class:`numpy.ndarray` the x and y grid sizes (m)
+        """
+
+        window = self.get_window((geotransform[0], geotransform[3],
+                                  geotransform[0] + shape[1] *
+                                  geotransform[1],
+                                  geotransform[3] + shape[0] *
+                                  geotransform[5]))
+
+        return self.x_m_array[window], self.y_m_array[window]
+
+    def get_gridwidth(self, geotransform=None, shape=None):
+        """
+        Return the average grid size of a grid of the tile
+
+        :param geotransform: `tuple` the geotransform of the grid, the DEM
+                             if None
+        :param shape: `tuple` the shape of the grid
+
+        :return: `float` the average grid size (m)
+        """
+
+        if geotransform is None:
+            x_m_array, y_m_array = self.x_m_array, self.y_m_array
+        else:
+            x_m_array, y_m_array = self.get_pixel_size_grids(geotransform,
+                                                             shape)
+
+        return 0.5 * (np.mean(x_m_array) + np.mean(y_m_array))
+
+    def get_output_file(self, subdir, suffix, one_dir):
+        """
+        Return the netCDF file of a multiplier of the tile
+
+        :param subdir: `str` the folder of the multiplier
+        :param suffix: `str` the suffix of the multiplier, e.g. '_mz_'
+        :param one_dir: `str` the direction
+
+        :return: `str` the file name
+        """
+
+        return pjoin(self.output_folder, subdir,
+                     self.name + suffix + one_dir + '.nc')
+
+    def get_dem_key(self, multiplier):
+        """
+        Return the cache key of the products a multiplier derives from the
+        DEM of the tile, see :mod:`utilities.derivative_cache`
+
+        :param multiplier: `str` 'shielding' or 'topographic'
+
+        :return: `str` the key
+        """
+
+        # the DEM is hashed once for all the multipliers
+        if self._dem_digest is None:
+            self._dem_digest = get_key(self.dem)
+
+        halo = None
+        if self.extents_halo is not None:
+            halo = sorted(self.extents_halo[multiplier].items())
+
+        return get_key(multiplier, self._dem_digest, self.dem_geotransform,
+                       self.extents_nobuffer, halo)